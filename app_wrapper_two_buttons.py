@@ -29,6 +29,8 @@ st.title("Wrapper 1–6 και 7–8 (MIN)")
 st.caption("**Ροή:** Πρώτα 1️⃣ (παράγει Step6), μετά 2️⃣ (χρησιμοποιεί αυτόματα το Step6).")
 
 WORKDIR = Path(__file__).parent
+# Ίδια cache Βήματος 1 με το CLI του step1_immutable_ALLINONE.py
+os.environ.setdefault("STEP1_CACHE_DIR", str(WORKDIR / ".step1_cache"))
 
 def _import_by_path(modname: str, path: Path):
     spec = importlib.util.spec_from_file_location(modname, str(path))
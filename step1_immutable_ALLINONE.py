@@ -20,58 +20,190 @@ from pathlib import Path
 είναι ΟΡΙΣΤΙΚΕΣ και δεν αλλάζουν ποτέ στα επόμενα βήματα.
 """
 
+from collections.abc import Mapping
 from dataclasses import dataclass, field
 from typing import Dict, List, Set, Tuple, Optional, FrozenSet
 import pandas as pd
 import numpy as np
-import itertools
+import gzip
+import hashlib
+import json
+import os
+import heapq
 import math
+import random
+import time
 import re
 import ast
 from pathlib import Path
 
+# Πάνω από τόσες ισόρροπες κατανομές το Βήμα 1 περνά σε ευρετική δειγματοληψία
+STEP1_MAX_EXACT_PARTITIONS = 2_000_000
+STEP1_HEURISTIC_SEED = 42
+STEP1_HEURISTIC_TIME_BUDGET = 5.0  # δευτερόλεπτα
+STEP1_HEURISTIC_MAX_SAMPLES = 2000
+# Κάτω από τόσες κατανομές η παράλληλη αναζήτηση δεν αξίζει το κόστος των διεργασιών
+STEP1_PARALLEL_MIN_PARTITIONS = 50_000
+# Cache αποτελεσμάτων στο δίσκο (κοινός για CLI και app): φάκελος και μέγιστο μέγεθος
+STEP1_CACHE_DIR_ENV = "STEP1_CACHE_DIR"
+STEP1_CACHE_MAX_BYTES = 64 * 1024 * 1024
 
-@dataclass(frozen=True)
+
+def _assignments_fingerprint(pairs) -> str:
+    """Hash των ζευγών όνομα→τμήμα (ανεξάρτητο από τη σειρά)"""
+    h = hashlib.sha256()
+    for name, cls in sorted((str(n), str(c)) for n, c in pairs):
+        h.update(name.encode("utf-8"))
+        h.update(b"\x1f")
+        h.update(cls.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def _first_by_name(df: pd.DataFrame, col_name: str) -> pd.Series:
+    """Τιμές της στήλης με index το ΟΝΟΜΑ (πρώτη εμφάνιση κάθε ονόματος)"""
+    series = pd.Series(df[col_name].to_numpy(), index=df["ΟΝΟΜΑ"].to_numpy())
+    return series[~series.index.duplicated(keep="first")]
+
+
+class _ScenarioAssignments(Mapping):
+    """Read-only όνομα→τμήμα πάνω στους συμπαγείς κωδικούς ενός σεναρίου"""
+    __slots__ = ("_index", "_codes", "_labels")
+    
+    def __init__(self, index: Dict[str, int], codes: bytes, labels: Tuple[str, ...]):
+        self._index = index
+        self._codes = codes
+        self._labels = labels
+    
+    def __getitem__(self, name: str) -> str:
+        return self._labels[self._codes[self._index[name]]]
+    
+    def __iter__(self):
+        return iter(self._index)
+    
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+@dataclass(frozen=True, slots=True)
 class Step1Scenario:
-    """Immutable σενάριο βήματος 1"""
+    """
+    Immutable σενάριο βήματος 1.
+    
+    Οι αναθέσεις αποθηκεύονται συμπαγώς: student_index (όνομα → θέση, κοινό για
+    όλα τα σενάρια) και class_codes (θέση → δείκτης στο class_labels, 1 byte).
+    """
     id: int
     column_name: str  # "ΒΗΜΑ1_ΣΕΝΑΡΙΟ_1"
-    assignments: Dict[str, str]  # name -> class
+    student_index: Dict[str, int]
+    class_codes: bytes
+    class_labels: Tuple[str, ...]
     description: str
     broken_friendships: int
     metadata: Dict[str, any] = field(default_factory=dict)
+    fingerprint: str = field(init=False, default="", compare=False)
+    members: Dict[str, Tuple[str, ...]] = field(init=False, default=None, compare=False, repr=False)
+    
+    def __post_init__(self):
+        members = {label: [] for label in self.class_labels}
+        for name, pos in self.student_index.items():
+            members[self.class_labels[self.class_codes[pos]]].append(name)
+        object.__setattr__(self, "members", {label: tuple(m) for label, m in members.items()})
+        object.__setattr__(self, "fingerprint", _assignments_fingerprint(self.assignments.items()))
+    
+    @classmethod
+    def from_assignments(cls, id: int, column_name: str, assignments: Dict[str, str],
+                         description: str, broken_friendships: int,
+                         metadata: Optional[Dict[str, any]] = None, *,
+                         student_index: Optional[Dict[str, int]] = None,
+                         class_labels: Optional[Tuple[str, ...]] = None) -> "Step1Scenario":
+        """Δημιουργία από λεξικό όνομα→τμήμα (με προαιρετικά κοινά index/labels)"""
+        if student_index is None:
+            student_index = {name: i for i, name in enumerate(assignments)}
+        if class_labels is None:
+            class_labels = tuple(dict.fromkeys(assignments.values()))
+        label_pos = {label: i for i, label in enumerate(class_labels)}
+        codes = bytearray(len(student_index))
+        for name, pos in student_index.items():
+            codes[pos] = label_pos[assignments[name]]
+        return cls(
+            id=id,
+            column_name=column_name,
+            student_index=student_index,
+            class_codes=bytes(codes),
+            class_labels=tuple(class_labels),
+            description=description,
+            broken_friendships=broken_friendships,
+            metadata=dict(metadata or {}),
+        )
+    
+    @property
+    def assignments(self) -> Mapping:
+        """name -> class (read-only)"""
+        return _ScenarioAssignments(self.student_index, self.class_codes, self.class_labels)
     
     def get_assignment(self, student_name: str) -> Optional[str]:
         """Read-only πρόσβαση σε ανάθεση"""
-        return self.assignments.get(student_name)
+        pos = self.student_index.get(student_name)
+        return None if pos is None else self.class_labels[self.class_codes[pos]]
     
     def get_students_in_class(self, class_name: str) -> List[str]:
         """Επιστρέφει λίστα μαθητών σε τμήμα"""
-        return [name for name, cls in self.assignments.items() if cls == class_name]
+        return list(self.members.get(class_name, ()))
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Step1Results:
-    """Immutable αποτελέσματα βήματος 1"""
+    """Immutable αποτελέσματα βήματος 1 (με ευρετήρια ανά id και ανά στήλη)"""
     scenarios: Tuple[Step1Scenario, ...]
     friendships: FrozenSet[Tuple[str, str]]
     teacher_kids: Tuple[str, ...]
     num_classes: int
     creation_timestamp: str
+    # Πίνακας φιλιών (matrix-style φύλλα): A[i, j] = ο friendship_names[i] δήλωσε
+    # φίλο τον friendship_names[j]. None όταν οι φιλίες ήρθαν από στήλη ΦΙΛΟΙ.
+    friendship_names: Tuple[str, ...] = field(default=(), compare=False, repr=False)
+    friendship_matrix: Optional[np.ndarray] = field(default=None, compare=False, repr=False)
+    by_id: Dict[int, Step1Scenario] = field(init=False, default=None, compare=False, repr=False)
+    by_column: Dict[str, Step1Scenario] = field(init=False, default=None, compare=False, repr=False)
+    
+    def __post_init__(self):
+        by_id, by_column = {}, {}
+        for scenario in self.scenarios:
+            by_id.setdefault(scenario.id, scenario)
+            by_column.setdefault(scenario.column_name, scenario)
+        object.__setattr__(self, "by_id", by_id)
+        object.__setattr__(self, "by_column", by_column)
     
     def get_scenario(self, scenario_id: int) -> Optional[Step1Scenario]:
         """Επιστρέφει σενάριο με βάση ID"""
-        for scenario in self.scenarios:
-            if scenario.id == scenario_id:
-                return scenario
-        return None
+        return self.by_id.get(scenario_id)
     
     def get_scenario_by_column(self, column_name: str) -> Optional[Step1Scenario]:
         """Επιστρέφει σενάριο με βάση όνομα στήλης"""
-        for scenario in self.scenarios:
-            if scenario.column_name == column_name:
-                return scenario
-        return None
+        return self.by_column.get(column_name)
+    
+    def fingerprints(self) -> Dict[str, str]:
+        """Αποθηκευμένα fingerprints ανά στήλη ΒΗΜΑ1_ΣΕΝΑΡΙΟ_X"""
+        return {scenario.column_name: scenario.fingerprint for scenario in self.scenarios}
+    
+    def _column_matches_fingerprint(self, df: pd.DataFrame, scenario: Step1Scenario) -> bool:
+        """O(n) έλεγχος: ίδιο hash ζευγών όνομα→τμήμα με το αποθηκευμένο"""
+        names = list(scenario.assignments)
+        actual = _first_by_name(df, scenario.column_name).reindex(names)
+        if actual.isna().any():
+            return False
+        return _assignments_fingerprint(zip(names, actual.astype(str).str.strip())) == scenario.fingerprint
+    
+    def verify_fingerprints(self, df: pd.DataFrame) -> bool:
+        """Γρήγορος έλεγχος immutability με μία σύγκριση hash ανά στήλη"""
+        return all(
+            scenario.column_name in df.columns and self._column_matches_fingerprint(df, scenario)
+            for scenario in self.scenarios
+        )
     
     def validate_immutability(self, df: pd.DataFrame) -> bool:
         """Ελέγχει ότι οι στήλες ΒΗΜΑ1_ΣΕΝΑΡΙΟ_X δεν έχουν αλλάξει"""
@@ -80,13 +212,16 @@ class Step1Results:
             if col_name not in df.columns:
                 raise ValueError(f"Λείπει στήλη {col_name} - παραβίαση immutability")
             
-            # Έλεγχος ότι οι αναθέσεις είναι οι αναμενόμενες
+            if self._column_matches_fingerprint(df, scenario):
+                continue
+            
+            # Έλεγχος ότι οι αναθέσεις είναι οι αναμενόμενες (ένα lookup ανά όνομα)
+            actual_by_name = _first_by_name(df, col_name)
             for student_name, expected_class in scenario.assignments.items():
-                student_row = df[df["ΟΝΟΜΑ"] == student_name]
-                if student_row.empty:
+                if student_name not in actual_by_name.index:
                     continue
                 
-                actual_class = student_row[col_name].iloc[0]
+                actual_class = actual_by_name[student_name]
                 if pd.notna(actual_class) and str(actual_class).strip() != expected_class:
                     raise ValueError(
                         f"ΠΑΡΑΒΙΑΣΗ IMMUTABILITY: {student_name} σε {col_name} "
@@ -98,9 +233,19 @@ class Step1Results:
 class Step1ImmutableProcessor:
     """Επεξεργαστής που εξασφαλίζει immutability του Βήματος 1"""
     
-    def __init__(self):
+    def __init__(self, max_exact_partitions: int = STEP1_MAX_EXACT_PARTITIONS,
+                 heuristic_seed: int = STEP1_HEURISTIC_SEED,
+                 heuristic_time_budget: float = STEP1_HEURISTIC_TIME_BUDGET,
+                 jobs: int = 1,
+                 cache: Optional["Step1ResultCache"] = None):
         self._results: Optional[Step1Results] = None
         self._is_locked: bool = False
+        self._friendship_adjacency: Optional[Tuple[Tuple[str, ...], np.ndarray]] = None
+        self.max_exact_partitions = max_exact_partitions
+        self.heuristic_seed = heuristic_seed
+        self.heuristic_time_budget = heuristic_time_budget
+        self.jobs = jobs
+        self.cache = cache
     
     def create_scenarios(self, df: pd.DataFrame, num_classes: Optional[int] = None) -> Step1Results:
         """Δημιουργία immutable σεναρίων"""
@@ -131,10 +276,25 @@ class Step1ImmutableProcessor:
         print(f"Εντοπίστηκαν {len(teacher_kids)} παιδιά εκπαιδευτικών")
         
         # Εξαγωγή φιλιών
+        self._friendship_adjacency = None
         friendships = self._extract_friendships(df_norm, teacher_kids)
+        adjacency_names, adjacency = self._friendship_adjacency or ((), None)
         
-        # Δημιουργία σεναρίων
-        scenarios = self._generate_scenarios(teacher_kids, num_classes, friendships)
+        # Δημιουργία σεναρίων (ή ανάκτηση από την cache)
+        scenarios = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(teacher_kids, friendships, num_classes, {
+                "max_exact_partitions": self.max_exact_partitions,
+                "heuristic_seed": self.heuristic_seed,
+                "heuristic_time_budget": self.heuristic_time_budget,
+            })
+            scenarios = self.cache.load(cache_key, teacher_kids)
+            if scenarios is not None:
+                print(f"Step1 cache hit ({cache_key[:12]})")
+        if scenarios is None:
+            scenarios = self._generate_scenarios(teacher_kids, num_classes, friendships)
+            if self.cache is not None:
+                self.cache.store(cache_key, scenarios)
         
         # Δημιουργία immutable αποτελεσμάτων
         self._results = Step1Results(
@@ -142,7 +302,9 @@ class Step1ImmutableProcessor:
             friendships=friendships,
             teacher_kids=tuple(teacher_kids),
             num_classes=num_classes,
-            creation_timestamp=pd.Timestamp.now().isoformat()
+            creation_timestamp=pd.Timestamp.now().isoformat(),
+            friendship_names=adjacency_names,
+            friendship_matrix=adjacency
         )
         
         print(f"Δημιουργήθηκαν {len(scenarios)} immutable σενάρια")
@@ -155,16 +317,13 @@ class Step1ImmutableProcessor:
         
         result_df = df.copy()
         
-        # Προσθήκη στηλών ΒΗΜΑ1_ΣΕΝΑΡΙΟ_X
+        # Προσθήκη στηλών ΒΗΜΑ1_ΣΕΝΑΡΙΟ_X: ένα map ανά στήλη, κενό για όσους
+        # δεν είναι παιδιά εκπαιδευτικών
         for scenario in self._results.scenarios:
-            col_name = scenario.column_name
-            result_df[col_name] = ""  # Αρχικοποίηση με κενές τιμές
-            
-            # Συμπλήρωση μόνο για παιδιά εκπαιδευτικών
-            for student_name, class_assigned in scenario.assignments.items():
-                mask = result_df["ΟΝΟΜΑ"] == student_name
-                if mask.any():
-                    result_df.loc[mask, col_name] = class_assigned
+            result_df[scenario.column_name] = (
+                result_df["ΟΝΟΜΑ"].map(dict(scenario.assignments)).fillna("")
+            )
+        result_df.attrs["step1_fingerprints"] = self._results.fingerprints()
         
         # ΚΛΕΙΔΩΜΑ - μετά από αυτό δεν επιτρέπονται αλλαγές
         self._is_locked = True
@@ -225,10 +384,12 @@ class Step1ImmutableProcessor:
         
         return result
     
+    _YES_TOKENS = frozenset({"Ν", "ΝΑΙ", "YES", "TRUE", "1", "Y"})
+    
     def _norm_yesno(self, val) -> str:
         """Κανονικοποίηση Ν/Ο τιμών"""
         s = str(val).strip().upper()
-        return "Ν" if s in {"Ν", "ΝΑΙ", "YES", "TRUE", "1", "Y"} else "Ο"
+        return "Ν" if s in self._YES_TOKENS else "Ο"
     
     def _get_teacher_kids(self, df: pd.DataFrame) -> List[str]:
         """Εντοπισμός παιδιών εκπαιδευτικών"""
@@ -238,14 +399,31 @@ class Step1ImmutableProcessor:
     def _find_friendship_columns(self, df: pd.DataFrame) -> List[str]:
         """Εντοπισμός στηλών φιλιών (στήλες με ονόματα μαθητών)"""
         student_names = set(df["ΟΝΟΜΑ"].astype(str).str.strip())
-        friendship_cols = []
+        col_names = pd.Index(df.columns).astype(str).str.strip()
+        mask = col_names.isin(student_names) & (col_names != "ΟΝΟΜΑ")
+        return list(df.columns[mask])
+    
+    def _friendship_adjacency_matrix(self, df: pd.DataFrame,
+                                     friendship_cols: List[str]) -> Tuple[Tuple[str, ...], np.ndarray]:
+        """
+        Μετατρέπει το N×N μπλοκ φιλιών σε boolean πίνακα γειτνίασης με ΜΙΑ διέλευση.
         
-        for col in df.columns:
-            col_name = str(col).strip()
-            if col_name in student_names and col_name != "ΟΝΟΜΑ":
-                friendship_cols.append(col)
+        Γραμμές/στήλες με το ίδιο όνομα ενώνονται (OR). Η διαγώνιος μηδενίζεται.
+        """
+        codes, names = pd.factorize(df["ΟΝΟΜΑ"].astype(str))
+        col_positions = np.flatnonzero(df.columns.isin(friendship_cols))
+        col_codes = names.get_indexer([str(df.columns[i]).strip() for i in col_positions])
         
-        return friendship_cols
+        # Κανονικοποίηση Ν/Ο για όλο το μπλοκ μαζί
+        block = df.iloc[:, col_positions].to_numpy().astype(str)
+        yes = np.isin(np.char.upper(np.char.strip(block)), list(self._YES_TOKENS))
+        
+        by_row_name = np.zeros((len(names), len(col_positions)), dtype=bool)
+        np.logical_or.at(by_row_name, codes, yes)
+        adjacency = np.zeros((len(names), len(names)), dtype=bool)
+        np.logical_or.at(adjacency.T, col_codes, by_row_name.T)
+        np.fill_diagonal(adjacency, False)
+        return tuple(names), adjacency
     
     def _extract_friendships(self, df: pd.DataFrame, teacher_kids: List[str]) -> FrozenSet[Tuple[str, str]]:
         """Εξαγωγή αμοιβαίων φιλιών μεταξύ παιδιών εκπαιδευτικών"""
@@ -257,18 +435,19 @@ class Step1ImmutableProcessor:
         if friendship_cols:
             print(f"Εντοπίστηκαν {len(friendship_cols)} στήλες φιλιών (matrix-style)")
             
-            for col in friendship_cols:
-                friend_name = str(col).strip()
-                if friend_name in teacher_kids_set:
-                    # Βρες ποια παιδιά εκπαιδευτικών έχουν γράψει το friend_name ως φίλο
-                    friend_mask = (df["ΟΝΟΜΑ"].isin(teacher_kids)) & (df[col].map(self._norm_yesno) == "Ν")
-                    students_who_wrote_this_friend = df[friend_mask]["ΟΝΟΜΑ"].tolist()
-                    
-                    for student in students_who_wrote_this_friend:
-                        if student != friend_name:  # Όχι φιλία με τον εαυτό του
-                            if student not in student_friends:
-                                student_friends[student] = set()
-                            student_friends[student].add(friend_name)
+            names, adjacency = self._friendship_adjacency_matrix(df, friendship_cols)
+            self._friendship_adjacency = (names, adjacency)
+            
+            # Αμοιβαίες φιλίες: A & A.T, μόνο μεταξύ παιδιών εκπαιδευτικών
+            kid_idx = pd.Index(names).get_indexer(list(dict.fromkeys(teacher_kids)))
+            kid_idx = kid_idx[kid_idx >= 0]
+            mutual = (adjacency & adjacency.T)[np.ix_(kid_idx, kid_idx)]
+            rows, cols = np.nonzero(np.triu(mutual, k=1))
+            friendships = {
+                tuple(sorted([names[kid_idx[i]], names[kid_idx[j]]])) for i, j in zip(rows, cols)
+            }
+            print(f"Βρέθηκαν {len(friendships)} αμοιβαίες φιλίες μεταξύ παιδιών εκπαιδευτικών")
+            return frozenset(friendships)
         
         # ΜΕΘΟΔΟΣ 2: Single-column ΦΙΛΟΙ (fallback)
         elif "ΦΙΛΟΙ" in df.columns:
@@ -310,15 +489,6 @@ class Step1ImmutableProcessor:
         print(f"Βρέθηκαν {len(friendships)} αμοιβαίες φιλίες μεταξύ παιδιών εκπαιδευτικών")
         return frozenset(friendships)
     
-    def _count_broken_friendships(self, teacher_kids: List[str], assign_map: Dict[str, str], 
-                               friendships: FrozenSet[Tuple[str, str]]) -> int:
-        """Μέτρηση σπασμένων φιλιών σε ένα σενάριο κατανομής"""
-        broken = 0
-        for friend1, friend2 in friendships:
-            if assign_map.get(friend1) != assign_map.get(friend2):
-                broken += 1
-        return broken
-    
     def _canonical_key(self, names: List[str], assign_map: Dict[str, str], class_labels_list: List[str]) -> Tuple:
         """Canonical key για αποφυγή duplicates"""
         buckets = []
@@ -332,6 +502,9 @@ class Step1ImmutableProcessor:
         """Δημιουργία σεναρίων με immutable structure"""
         class_labels_list = [f"Α{i+1}" for i in range(num_classes)]
         scenarios = []
+        # Κοινά για όλα τα σενάρια: όνομα → θέση και ετικέτες τμημάτων
+        student_index = {name: i for i, name in enumerate(dict.fromkeys(teacher_kids))}
+        class_labels = tuple(class_labels_list)
         
         if len(teacher_kids) <= num_classes:
             # ΚΑΝΟΝΑΣ 1: Σειριακή κατανομή
@@ -341,110 +514,488 @@ class Step1ImmutableProcessor:
             for i, name in enumerate(teacher_kids):
                 assignments[name] = class_labels_list[i % num_classes]
             
-            scenario = Step1Scenario(
+            scenario = Step1Scenario.from_assignments(
                 id=1,
                 column_name="ΒΗΜΑ1_ΣΕΝΑΡΙΟ_1",
                 assignments=assignments,
                 description="Κανόνας 1: Σειριακή κατανομή ≤1/τμήμα",
-                broken_friendships=0
+                broken_friendships=0,
+                student_index=student_index,
+                class_labels=class_labels
             )
             scenarios.append(scenario)
         else:
-            # ΚΑΝΟΝΑΣ 2: Εξαντλητική παραγωγή
-            print(f"Εφαρμογή Κανόνα 2 (εξαντλητική με φιλίες)")
-            valid_assignments = self._exhaustive_generation(teacher_kids, num_classes, friendships)
+            search_space = self._count_balanced_partitions(len(teacher_kids), num_classes)
+            if search_space > self.max_exact_partitions:
+                # ΚΑΝΟΝΑΣ 2 (ευρετικός): πολύ μεγάλος χώρος για ακριβή αναζήτηση
+                print(f"Εφαρμογή Κανόνα 2 (ευρετική δειγματοληψία, {search_space:,} κατανομές)")
+                valid_assignments, metadata = self._heuristic_sampling(
+                    teacher_kids, num_classes, friendships
+                )
+                metadata["search_space"] = search_space
+                description = "Κανόνας 2: Ισόρροπη κατανομή (ευρετική)"
+            else:
+                # ΚΑΝΟΝΑΣ 2: Εξαντλητική παραγωγή
+                print(f"Εφαρμογή Κανόνα 2 (εξαντλητική με φιλίες)")
+                valid_assignments = self._exhaustive_generation(teacher_kids, num_classes, friendships)
+                metadata = {}
+                description = "Κανόνας 2: Ισόρροπη κατανομή"
             
             for i, (assignments_dict, broken_count) in enumerate(valid_assignments[:5], 1):
-                scenario = Step1Scenario(
+                scenario = Step1Scenario.from_assignments(
                     id=i,
                     column_name=f"ΒΗΜΑ1_ΣΕΝΑΡΙΟ_{i}",
                     assignments=assignments_dict,
-                    description="Κανόνας 2: Ισόρροπη κατανομή",
-                    broken_friendships=broken_count
+                    description=description,
+                    broken_friendships=broken_count,
+                    metadata=metadata,
+                    student_index=student_index,
+                    class_labels=class_labels
                 )
                 scenarios.append(scenario)
         
         return scenarios
     
+    def _balanced_choices(self, counts: List[int], used: int, num_classes: int,
+                          q: int, r: int, full: int) -> List[int]:
+        """Επιτρεπτά τμήματα για το επόμενο παιδί (ισοκατανομή ≤1, canonical σειρά)"""
+        choices = []
+        for c in range(min(used + 1, num_classes)):
+            if counts[c] < q or (counts[c] == q and full < r):
+                choices.append(c)
+        return choices
+    
+    def _count_balanced_partitions(self, n: int, num_classes: int) -> int:
+        """Πλήθος ισόρροπων canonical κατανομών (μέγεθος χώρου αναζήτησης)"""
+        q, r = divmod(n, num_classes)
+        if q == 0:
+            return 1
+        return math.factorial(n) // (
+            math.factorial(q) ** (num_classes - r) * math.factorial(q + 1) ** r
+            * math.factorial(num_classes - r) * math.factorial(r)
+        )
+    
+    def _friend_index(self, teacher_kids: List[str],
+                      friendships: FrozenSet[Tuple[str, str]]) -> Tuple[List[List[int]], int]:
+        """
+        Φιλίες ως δείκτες: για κάθε παιδί i, οι φίλοι του με δείκτη < i.
+        Επιστρέφει και τις φιλίες που σπάνε πάντα (μόνο το ένα μέλος είναι στη λίστα).
+        """
+        index = {name: i for i, name in enumerate(teacher_kids)}
+        earlier = [[] for _ in teacher_kids]
+        always_broken = 0
+        for friend1, friend2 in friendships:
+            i, j = index.get(friend1), index.get(friend2)
+            if i is None or j is None:
+                if (i is None) != (j is None):
+                    always_broken += 1
+                continue
+            if i != j:
+                earlier[max(i, j)].append(min(i, j))
+        return earlier, always_broken
+    
+    def _branch_and_bound_top(self, n: int, num_classes: int, earlier: List[List[int]],
+                              always_broken: int = 0, limit: int = 5,
+                              prefix: Tuple[int, ...] = ()) -> Tuple[List[Tuple[int, Tuple[int, ...]]], int, bool]:
+        """
+        Branch-and-bound πάνω στις ισόρροπες canonical κατανομές.
+        
+        Κάθε κατανομή είναι restricted-growth string: το πρώτο παιδί πάει στο Α1 και
+        κάθε νέο τμήμα ανοίγει με τη σειρά, άρα κάθε διαμέριση εμφανίζεται ΜΙΑ φορά,
+        με τη σειρά που θα έβγαινε πρώτη από το itertools.product. Κρατά σε heap τις
+        `limit` καλύτερες κατά (σπασμένες φιλίες, σειρά παραγωγής) και κόβει κλαδιά
+        που ήδη σπάνε τουλάχιστον όσες φιλίες το χειρότερο κρατημένο σενάριο.
+        Με `prefix` ψάχνει μόνο το υποδέντρο με αυτές τις πρώτες αναθέσεις (shard).
+        
+        Returns:
+            ([(broken, path), ...] ταξινομημένα, πλήθος φύλλων, αν έγινε κλάδεμα)
+        """
+        q, r = divmod(n, num_classes)
+        counts = [0] * num_classes
+        path = [0] * n
+        heap: List[Tuple[int, int, Tuple[int, ...]]] = []  # (-broken, -seq, path)
+        state = {"leaves": 0, "pruned": False}
+        
+        used, full, broken = 0, 0, always_broken
+        for i, c in enumerate(prefix):
+            path[i] = c
+            counts[c] += 1
+            used = max(used, c + 1)
+            full += counts[c] == q + 1
+            broken += sum(1 for j in earlier[i] if path[j] != c)
+        
+        def rec(i: int, used: int, full: int, broken: int) -> bool:
+            if len(heap) == limit and broken >= -heap[0][0]:
+                state["pruned"] = True
+                return -heap[0][0] == 0  # 5 σενάρια χωρίς σπασμένες φιλίες: τέλος
+            if i == n:
+                if used == 1:
+                    return False
+                state["leaves"] += 1
+                item = (-broken, -state["leaves"], tuple(path))
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heapreplace(heap, item)
+                if len(heap) == limit and heap[0][0] == 0:
+                    state["pruned"] = True  # τα υπόλοιπα δεν εξετάζονται
+                    return True
+                return False
+            for c in self._balanced_choices(counts, used, num_classes, q, r, full):
+                path[i] = c
+                counts[c] += 1
+                delta = sum(1 for j in earlier[i] if path[j] != c)
+                stop = rec(i + 1, max(used, c + 1), full + (counts[c] == q + 1), broken + delta)
+                counts[c] -= 1
+                if stop:
+                    return True
+            return False
+        
+        rec(len(prefix), used, full, broken)
+        top = [(-neg_broken, p) for neg_broken, _seq, p in heap]
+        return sorted(top), state["leaves"], state["pruned"]
+    
+    def _balanced_prefixes(self, n: int, num_classes: int, depth: int) -> List[Tuple[int, ...]]:
+        """Όλα τα έγκυρα canonical προθέματα μήκους depth, με σειρά παραγωγής"""
+        q, r = divmod(n, num_classes)
+        counts = [0] * num_classes
+        prefixes = []
+        
+        def rec(prefix: Tuple[int, ...], used: int, full: int):
+            if len(prefix) == depth:
+                prefixes.append(prefix)
+                return
+            for c in self._balanced_choices(counts, used, num_classes, q, r, full):
+                counts[c] += 1
+                rec(prefix + (c,), max(used, c + 1), full + (counts[c] == q + 1))
+                counts[c] -= 1
+        
+        rec((), 0, 0)
+        return prefixes
+    
+    def _parallel_branch_and_bound_top(self, n: int, num_classes: int, earlier: List[List[int]],
+                                       always_broken: int, limit: int,
+                                       jobs: int) -> Tuple[List[Tuple[int, Tuple[int, ...]]], int, bool]:
+        """
+        Παράλληλο branch-and-bound: shards ανά πρόθεμα αναθέσεων των πρώτων παιδιών,
+        σε process pool. Τα top-`limit` των shards συγχωνεύονται κατά (broken, path),
+        άρα το αποτέλεσμα είναι ίδιο με τη σειριακή εκτέλεση.
+        """
+        depth = 1
+        prefixes = self._balanced_prefixes(n, num_classes, depth)
+        while len(prefixes) < 4 * jobs and depth < n - 1:
+            depth += 1
+            prefixes = self._balanced_prefixes(n, num_classes, depth)
+        
+        print(f"Παράλληλη αναζήτηση: {len(prefixes)} shards σε {jobs} διεργασίες")
+        tasks = [(n, num_classes, earlier, always_broken, limit, p) for p in prefixes]
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                shard_results = list(pool.map(_step1_bnb_shard, tasks))
+        except Exception as e:
+            print(f"Η παράλληλη αναζήτηση απέτυχε ({e}) - σειριακή εκτέλεση")
+            return self._branch_and_bound_top(n, num_classes, earlier, always_broken, limit=limit)
+        
+        merged = sorted(t for top, _, _ in shard_results for t in top)[:limit]
+        leaves = sum(l for _, l, _ in shard_results)
+        pruned = any(p for _, _, p in shard_results)
+        return merged, leaves, pruned
+    
     def _exhaustive_generation(self, teacher_kids: List[str], num_classes: int, 
-                             friendships: FrozenSet[Tuple[str, str]]) -> List[Tuple[Dict[str, str], int]]:
-        """Εξαντλητική παραγωγή σεναρίων"""
+                             friendships: FrozenSet[Tuple[str, str]],
+                             jobs: Optional[int] = None) -> List[Tuple[Dict[str, str], int]]:
+        """
+        Εξαντλητική (branch-and-bound) παραγωγή των 5 καλύτερων σεναρίων.
+        
+        Ίδιο αποτέλεσμα με την πλήρη απαρίθμηση: αν υπάρχουν >5 έγκυρα σενάρια
+        κρατά έως 5 με τις λιγότερες σπασμένες φιλίες (μόνο τα μηδενικά, αν
+        υπάρχουν), αλλιώς όλα με τη σειρά παραγωγής. Με jobs>1 (ή self.jobs) η
+        αναζήτηση μοιράζεται σε διεργασίες με το ίδιο αποτέλεσμα.
+        """
         class_labels_list = [f"Α{i+1}" for i in range(num_classes)]
-        valid_scenarios = []
-        seen_canonical = set()
         
         print(f"Παραγωγή σεναρίων για {len(teacher_kids)} παιδιά σε {num_classes} τμήματα...")
         
-        # Εξαντλητική παραγωγή
-        total_combinations = num_classes ** len(teacher_kids)
-        print(f"Συνολικές περιπτώσεις: {total_combinations:,}")
+        total_partitions = self._count_balanced_partitions(len(teacher_kids), num_classes)
+        print(f"Ισόρροπες κατανομές (χώρος αναζήτησης): {total_partitions:,}")
+        
+        earlier, always_broken = self._friend_index(teacher_kids, friendships)
+        jobs = self.jobs if jobs is None else jobs
+        if jobs > 1 and total_partitions >= STEP1_PARALLEL_MIN_PARTITIONS:
+            top, leaves, pruned = self._parallel_branch_and_bound_top(
+                len(teacher_kids), num_classes, earlier, always_broken, limit=5, jobs=jobs
+            )
+        else:
+            top, leaves, pruned = self._branch_and_bound_top(
+                len(teacher_kids), num_classes, earlier, always_broken, limit=5
+            )
+        print(f"Εξετάστηκαν {leaves:,} πλήρεις κατανομές" + (" (με κλάδεμα)" if pruned else ""))
+        
+        if leaves <= 5 and not pruned:
+            # ≤5 έγκυρα σενάρια: όλα, με τη σειρά παραγωγής
+            top.sort(key=lambda x: x[1])
+        elif top and top[0][0] == 0:
+            # Υπάρχουν σενάρια χωρίς σπασμένες φιλίες: κρατάμε μόνο αυτά
+            top = [t for t in top if t[0] == 0]
+        
+        valid_scenarios = [
+            ({teacher_kids[i]: class_labels_list[c] for i, c in enumerate(p)}, broken)
+            for broken, p in top
+        ]
+        
+        print(f"Τελική επιλογή: {len(valid_scenarios)} σενάρια")
+        return valid_scenarios
+    
+    def _heuristic_sampling(self, teacher_kids: List[str], num_classes: int,
+                            friendships: FrozenSet[Tuple[str, str]],
+                            max_samples: int = STEP1_HEURISTIC_MAX_SAMPLES) -> Tuple[List[Tuple[Dict[str, str], int]], Dict]:
+        """
+        Ευρετική παραγωγή σεναρίων για πολύ μεγάλο αριθμό παιδιών εκπαιδευτικών.
+        
+        Τυχαίες ισόρροπες κατανομές (seeded) βελτιώνονται με ανταλλαγές ζευγών που
+        μειώνουν τις σπασμένες φιλίες. Τα διπλότυπα απορρίπτονται με το canonical key
+        και η αναζήτηση σταματά στο χρονικό όριο ή στο max_samples.
+        """
+        class_labels_list = [f"Α{i+1}" for i in range(num_classes)]
+        n = len(teacher_kids)
+        q, r = divmod(n, num_classes)
+        sizes = [q + 1] * r + [q] * (num_classes - r)
+        
+        earlier, always_broken = self._friend_index(teacher_kids, friendships)
+        neighbours = [set() for _ in range(n)]
+        for i, friends in enumerate(earlier):
+            for j in friends:
+                neighbours[i].add(j)
+                neighbours[j].add(i)
+        
+        rng = random.Random(self.heuristic_seed)
+        deadline = time.monotonic() + self.heuristic_time_budget
+        found: Dict[Tuple, Tuple[int, int, Dict[str, str]]] = {}
+        samples = 0
         
-        for assignment in itertools.product(class_labels_list, repeat=len(teacher_kids)):
-            assign_map = {teacher_kids[i]: assignment[i] for i in range(len(teacher_kids))}
+        print(f"Ευρετική δειγματοληψία (seed={self.heuristic_seed}, όριο {self.heuristic_time_budget}s)...")
+        
+        while samples < max_samples and time.monotonic() < deadline:
+            samples += 1
             
-            # ΕΛΕΓΧΟΣ 1: Ισοκατανομή ≤1
-            class_counts = {c: 0 for c in class_labels_list}
-            for name in teacher_kids:
-                class_counts[assign_map[name]] += 1
+            # Τυχαία ισόρροπη κατανομή
+            order = list(range(n))
+            rng.shuffle(order)
+            cls = [0] * n
+            pos = 0
+            for c, size in enumerate(sizes):
+                for i in order[pos:pos + size]:
+                    cls[i] = c
+                pos += size
             
-            counts_list = list(class_counts.values())
-            if max(counts_list) - min(counts_list) > 1:
-                continue  # Απόρριψη ανισοκατανομής >1
+            # Τοπικές ανταλλαγές όσο μειώνονται οι σπασμένες φιλίες
+            improved = True
+            while improved and time.monotonic() < deadline:
+                improved = False
+                for i in order:
+                    for j in range(n):
+                        a, b = cls[i], cls[j]
+                        if a == b:
+                            continue
+                        gain = 0
+                        for f in neighbours[i]:
+                            if f != j:
+                                gain += (cls[f] != a) - (cls[f] != b)
+                        for f in neighbours[j]:
+                            if f != i:
+                                gain += (cls[f] != b) - (cls[f] != a)
+                        if gain > 0:
+                            cls[i], cls[j] = b, a
+                            improved = True
             
-            # ΕΛΕΓΧΟΣ 2: Όχι όλα στο ίδιο τμήμα
-            unique_classes = set(assign_map.values())
-            if len(unique_classes) == 1:
-                continue  # Απόρριψη
+            # Canonical μορφή: τα τμήματα αριθμούνται με σειρά εμφάνισης
+            relabel: Dict[int, int] = {}
+            for c in cls:
+                relabel.setdefault(c, len(relabel))
+            assign_map = {teacher_kids[i]: class_labels_list[relabel[c]] for i, c in enumerate(cls)}
             
-            # ΕΛΕΓΧΟΣ 3: Canonical uniqueness
             canon_key = self._canonical_key(teacher_kids, assign_map, class_labels_list)
-            if canon_key in seen_canonical:
+            if canon_key in found:
                 continue
-            seen_canonical.add(canon_key)
-            
-            # Υπολογισμός σπασμένων φιλιών
-            broken_friendships = self._count_broken_friendships(teacher_kids, assign_map, friendships)
+            broken = always_broken + sum(
+                1 for i, friends in enumerate(earlier) for j in friends if cls[i] != cls[j]
+            )
+            found[canon_key] = (broken, len(found), assign_map)
             
-            valid_scenarios.append((assign_map, broken_friendships))
+            if sum(1 for b, _, _ in found.values() if b == 0) >= 5:
+                break
         
-        print(f"Έγκυρα σενάρια: {len(valid_scenarios)}")
+        ranked = sorted(found.values(), key=lambda x: (x[0], x[1]))
+        if ranked and ranked[0][0] == 0:
+            ranked = [x for x in ranked if x[0] == 0]
+        valid_scenarios = [(assign_map, broken) for broken, _, assign_map in ranked[:5]]
         
-        # Φιλτράρισμα αν >5
-        if len(valid_scenarios) > 5:
-            print("Εφαρμογή φιλτραρίσματος...")
-            
-            # Προτεραιότητα σε σενάρια με λιγότερα σπασμένα φιλιά
-            min_broken = min(s[1] for s in valid_scenarios)
-            if min_broken == 0:
-                scenarios_without_breaks = [s for s in valid_scenarios if s[1] == 0]
-                print(f"Βρέθηκαν {len(scenarios_without_breaks)} σενάρια χωρίς σπασμένες φιλίες")
-                valid_scenarios = scenarios_without_breaks
-            else:
-                print(f"Όλα σπάζουν φιλίες (min: {min_broken}) - ταξινόμηση")
-                valid_scenarios.sort(key=lambda x: x[1])
-            
-            # Τελική επιλογή 5 σεναρίων
-            if len(valid_scenarios) > 5:
-                valid_scenarios = valid_scenarios[:5]
-        
-        print(f"Τελική επιλογή: {len(valid_scenarios)} σενάρια")
-        return valid_scenarios
+        print(f"Δείγματα: {samples}, μοναδικά σενάρια: {len(found)}, "
+              f"τελική επιλογή: {len(valid_scenarios)}")
+        metadata = {
+            "heuristic": True,
+            "method": "random_balanced_sampling+local_swaps",
+            "seed": self.heuristic_seed,
+            "samples": samples,
+            "time_budget": self.heuristic_time_budget,
+        }
+        return valid_scenarios, metadata
+
+
+def _step1_bnb_shard(task):
+    """Worker του process pool: branch-and-bound σε ένα shard (πρόθεμα)"""
+    n, num_classes, earlier, always_broken, limit, prefix = task
+    return Step1ImmutableProcessor()._branch_and_bound_top(
+        n, num_classes, earlier, always_broken, limit=limit, prefix=prefix
+    )
+
+
+# === CACHE ===
+
+class Step1ResultCache:
+    """
+    Content-addressed cache σεναρίων Βήματος 1 στο δίσκο.
+    
+    Το κλειδί είναι hash των παιδιών εκπαιδευτικών (με σειρά), των αμοιβαίων
+    φιλιών, του αριθμού τμημάτων και των ρυθμίσεων αναζήτησης. Κάθε εγγραφή είναι
+    ένα μικρό gzip JSON με τους κωδικούς τμημάτων. Το συνολικό μέγεθος φράσσεται
+    από max_bytes με LRU εκκαθάριση (το mtime ανανεώνεται σε κάθε hit).
+    """
+    FORMAT_VERSION = 1
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = STEP1_CACHE_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.environ.get(STEP1_CACHE_DIR_ENV) or Path(__file__).parent / ".step1_cache"
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+    
+    def make_key(self, teacher_kids: List[str], friendships: FrozenSet[Tuple[str, str]],
+                 num_classes: int, settings: Dict) -> str:
+        payload = json.dumps({
+            "version": self.FORMAT_VERSION,
+            "teacher_kids": list(teacher_kids),
+            "friendships": sorted(list(pair) for pair in friendships),
+            "num_classes": num_classes,
+            "settings": settings,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json.gz"
+    
+    def load(self, key: str, teacher_kids: List[str]) -> Optional[List[Step1Scenario]]:
+        """Σενάρια από την cache ή None (miss / κατεστραμμένη εγγραφή)"""
+        path = self._path(key)
+        student_index = {name: i for i, name in enumerate(dict.fromkeys(teacher_kids))}
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            class_labels = tuple(data["class_labels"])
+            scenarios = [
+                Step1Scenario(
+                    id=item["id"],
+                    column_name=item["column_name"],
+                    student_index=student_index,
+                    class_codes=bytes.fromhex(item["codes"]),
+                    class_labels=class_labels,
+                    description=item["description"],
+                    broken_friendships=item["broken_friendships"],
+                    metadata=item["metadata"],
+                )
+                for item in data["scenarios"]
+            ]
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, KeyError, TypeError):
+            # κομμένο gzip, άκυρο JSON ή λάθος σχήμα: η εγγραφή σβήνεται και μετρά ως miss
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return scenarios
+    
+    def store(self, key: str, scenarios: List[Step1Scenario]) -> None:
+        """Αποθήκευση σεναρίων και εκκαθάριση αν ξεπεραστεί το όριο μεγέθους"""
+        data = {
+            "class_labels": list(scenarios[0].class_labels) if scenarios else [],
+            "scenarios": [
+                {
+                    "id": sc.id,
+                    "column_name": sc.column_name,
+                    "codes": sc.class_codes.hex(),
+                    "description": sc.description,
+                    "broken_friendships": sc.broken_friendships,
+                    "metadata": sc.metadata,
+                }
+                for sc in scenarios
+            ],
+        }
+        path = self._path(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._evict()
+        except (OSError, TypeError) as e:
+            print(f"Step1 cache: αποτυχία αποθήκευσης ({e})")
+    
+    def _evict(self) -> None:
+        entries = []
+        for p in self.cache_dir.glob("*.json.gz"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
 
 
 # === UTILITY FUNCTIONS ===
 
-def create_immutable_step1(df: pd.DataFrame, num_classes: Optional[int] = None) -> Tuple[pd.DataFrame, Step1Results]:
+def create_immutable_step1(df: pd.DataFrame, num_classes: Optional[int] = None, *,
+                           max_exact_partitions: int = STEP1_MAX_EXACT_PARTITIONS,
+                           heuristic_seed: int = STEP1_HEURISTIC_SEED,
+                           heuristic_time_budget: float = STEP1_HEURISTIC_TIME_BUDGET,
+                           jobs: int = 1,
+                           use_cache: bool = True,
+                           cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, Step1Results]:
     """
     Δημιουργεί immutable αποτελέσματα βήματος 1.
     
     Args:
         df: Αρχικό DataFrame με δεδομένα μαθητών
         num_classes: Αριθμός τμημάτων (αν None, αυτόματος υπολογισμός)
+        max_exact_partitions: Πάνω από τόσες ισόρροπες κατανομές χρησιμοποιείται
+            ευρετική δειγματοληψία αντί για ακριβή αναζήτηση
+        heuristic_seed: Seed της ευρετικής δειγματοληψίας
+        heuristic_time_budget: Χρονικό όριο (δευτερόλεπτα) της δειγματοληψίας
+        jobs: Διεργασίες για την ακριβή αναζήτηση (0 = όλοι οι πυρήνες)
+        use_cache: Χρήση της cache αποτελεσμάτων στο δίσκο
+        cache_dir: Φάκελος cache (default: $STEP1_CACHE_DIR ή .step1_cache δίπλα στο αρχείο)
     
     Returns:
         (DataFrame με στήλες ΒΗΜΑ1_ΣΕΝΑΡΙΟ_X, Step1Results object)
     """
-    processor = Step1ImmutableProcessor()
+    processor = Step1ImmutableProcessor(
+        max_exact_partitions=max_exact_partitions,
+        heuristic_seed=heuristic_seed,
+        heuristic_time_budget=heuristic_time_budget,
+        jobs=jobs or os.cpu_count() or 1,
+        cache=Step1ResultCache(cache_dir) if use_cache else None,
+    )
     results = processor.create_scenarios(df, num_classes)
     updated_df = processor.apply_to_dataframe(df)
     
@@ -530,29 +1081,79 @@ if __name__ == "__main__":
 # ===============================
 import re as __re_exact
 import pandas as __pd_exact
+import numpy as __np_exact
 from pandas import ExcelWriter as __ExcelWriter_exact
 
 def __scenario_index_exact(colname: str) -> int:
     m = __re_exact.search(r'(\d+)$', str(colname))
     return int(m.group(1)) if m else 9999
 
-def export_exact_multisheet(df_with_step1: __pd_exact.DataFrame, output_file: str) -> None:
+EXACT_BASE_SHEET_NAME = "ΒΑΣΗ"
+EXACT_LAYOUTS = ("full", "compact")
+
+def __exact_sheets(df_with_step1: __pd_exact.DataFrame, layout: str):
+    """(όνομα φύλλου, στήλες) για κάθε φύλλο εξόδου, με τη σειρά εγγραφής."""
+    if layout not in EXACT_LAYOUTS:
+        raise ValueError(f"Άγνωστο layout: {layout} (επιτρέπονται: {', '.join(EXACT_LAYOUTS)})")
     scenario_cols = [c for c in df_with_step1.columns if str(c).startswith("ΒΗΜΑ1_ΣΕΝΑΡΙΟ_")]
     scenario_cols = sorted(scenario_cols, key=__scenario_index_exact)
     base_cols = [c for c in df_with_step1.columns if c not in scenario_cols]
-    with __ExcelWriter_exact(output_file, engine="openpyxl") as writer:
-        for col in scenario_cols:
-            df_out = df_with_step1[base_cols + [col]].copy()
-            df_out.to_excel(writer, index=False, sheet_name=str(col)[:31])
+    if layout == "full":
+        return [(str(col)[:31], base_cols + [col]) for col in scenario_cols]
+    # compact: ένα κοινό φύλλο βάσης + στενά φύλλα ΟΝΟΜΑ/τμήμα ανά σενάριο
+    key_cols = ["ΟΝΟΜΑ"] if "ΟΝΟΜΑ" in base_cols else []
+    return [(EXACT_BASE_SHEET_NAME, base_cols)] + [(str(col)[:31], key_cols + [col]) for col in scenario_cols]
+
+def __write_sheet_streaming(workbook, sheet_name: str, df_out: __pd_exact.DataFrame, header_fmt) -> None:
+    # constant_memory: οι γραμμές γράφονται με τη σειρά και εκκενώνονται στο δίσκο
+    ws = workbook.add_worksheet(sheet_name)
+    ws.write_row(0, 0, [str(c) for c in df_out.columns], header_fmt)
+    values = df_out.astype(object).where(df_out.notna(), None)
+    for r, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        for c, v in enumerate(row):
+            if v is None:
+                continue
+            ws.write(r, c, v.item() if isinstance(v, __np_exact.generic) else v)
+
+def export_exact_multisheet(
+    df_with_step1: __pd_exact.DataFrame,
+    output_file: str,
+    *,
+    streaming: bool = False,
+    layout: str = "full",
+) -> None:
+    """
+    Ένα φύλλο ανά ΒΗΜΑ1_ΣΕΝΑΡΙΟ_k.
+    - layout="full" (προεπιλογή): κάθε φύλλο έχει όλες τις βασικές στήλες + τη στήλη του σεναρίου.
+    - layout="compact": φύλλο «ΒΑΣΗ» με τις βασικές στήλες + στενά φύλλα (ΟΝΟΜΑ, ΒΗΜΑ1_ΣΕΝΑΡΙΟ_k).
+      Δεν είναι κατάλληλο ως είσοδος του Βήματος 2, που περιμένει πλήρη φύλλα.
+    - streaming=True: xlsxwriter με constant_memory (γραμμή-γραμμή, χωρίς όλο το workbook στη μνήμη).
+    """
+    sheets = __exact_sheets(df_with_step1, layout)
+    if not streaming:
+        with __ExcelWriter_exact(output_file, engine="openpyxl") as writer:
+            for sheet_name, cols in sheets:
+                df_out = df_with_step1[cols].copy()
+                df_out.to_excel(writer, index=False, sheet_name=sheet_name)
+        return
+
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(str(output_file), {"constant_memory": True})
+    try:
+        header_fmt = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        for sheet_name, cols in sheets:
+            __write_sheet_streaming(workbook, sheet_name, df_with_step1[cols], header_fmt)
+    finally:
+        workbook.close()
 
 # ===============================
 # CLI entrypoint
 # ===============================
 def _auto_pick_sheet(xl):
+    # Μόνο οι επικεφαλίδες κάθε φύλλου (nrows=0)· πλήρες parse γίνεται μόνο για το επιλεγμένο
     for s in xl.sheet_names:
-        df_try = xl.parse(s)
-        cands = [c for c in df_try.columns if str(c).startswith("ΒΗΜΑ1_ΣΕΝΑΡΙΟ_")]
-        if cands:
+        cols = xl.parse(s, nrows=0).columns
+        if any(str(c).startswith("ΒΗΜΑ1_ΣΕΝΑΡΙΟ_") for c in cols):
             return s
     return xl.sheet_names[0]
 
@@ -563,6 +1164,11 @@ if __name__ == "__main__":
     parser.add_argument("--sheet", "-s", default=None, help="(optional) Sheet name")
     parser.add_argument("--num-classes", "-n", type=int, default=None, help="Force number of classes (optional)")
     parser.add_argument("--output", "-o", default="STEP1_IMMUTABLE_MULTISHEET_NODUP.xlsx", help="Output filename")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Processes for the exact Step 1 search (0 = all cores)")
+    parser.add_argument("--cache-dir", default=None, help=f"Step 1 result cache directory (default: ${STEP1_CACHE_DIR_ENV} or .step1_cache next to this file)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the Step 1 result cache")
+    parser.add_argument("--streaming", action="store_true", help="Write the workbook row by row (xlsxwriter constant_memory)")
+    parser.add_argument("--layout", choices=EXACT_LAYOUTS, default="full", help="full: base columns on every scenario sheet; compact: one base sheet + ΟΝΟΜΑ/class sheets")
     args = parser.parse_args()
 
     import pandas as _pd
@@ -576,11 +1182,14 @@ if __name__ == "__main__":
     df0 = xl.parse(sheet_name)
 
     try:
-        df_with_step1, results_obj = create_immutable_step1(df0, num_classes=args.num_classes)
+        df_with_step1, results_obj = create_immutable_step1(
+            df0, num_classes=args.num_classes, jobs=args.jobs,
+            use_cache=not args.no_cache, cache_dir=args.cache_dir
+        )
     except Exception as e:
         print("❌ Σφάλμα στο create_immutable_step1:", e)
         sys.exit(1)
 
-    export_exact_multisheet(df_with_step1, args.output)
+    export_exact_multisheet(df_with_step1, args.output, streaming=args.streaming, layout=args.layout)
     print(f"✅ OK: {args.output}")
 
@@ -3,16 +3,39 @@
 Βήμα 2 — Finalize & Exports
 - Περιλαμβάνει:
   • finalize_step2_assignments / lock_step2_results
+  • run_step2_scenarios / export_step2_layouts → ένας υπολογισμός ανά σενάριο,
+    όλα τα layouts (minimal/full) από τα ίδια αποτελέσματα
   • export_step2_minimal_nextcol (παλιό "ελαφρύ")
   • export_step2_nextcol_full (ΝΕΟ, DEFAULT) → κρατά ΟΛΕΣ τις αρχικές στήλες
     και προσθέτει τη ΒΗΜΑ2_ΣΕΝΑΡΙΟ_N αμέσως δεξιά από τη ΒΗΜΑ1_ΣΕΝΑΡΙΟ_N,
     ένα φύλλο ανά σενάριο.
 """
 from typing import Optional, Tuple, List, Dict
+import numpy as np
 import pandas as pd
 import re, math
 
 # ------------------ Κλείδωμα Βήματος 2 ------------------
+def _water_fill(sizes: np.ndarray, extra: int) -> np.ndarray:
+    """
+    Θέσεις ανά τμήμα για extra νέους μαθητές ώστε τα μεγέθη να εξισωθούν όσο γίνεται:
+    ανεβαίνουν πρώτα τα μικρότερα τμήματα. Το υπόλοιπο (1 θέση ανά τμήμα) πάει στα τμήματα
+    του κατώτατου επιπέδου με τη σειρά του sizes.
+    """
+    lo, hi = int(sizes.min()), int(sizes.min()) + extra
+    while lo < hi:  # μέγιστο επίπεδο L με sum(max(0, L - sizes)) <= extra
+        mid = (lo + hi + 1) // 2
+        if np.maximum(0, mid - sizes).sum() <= extra:
+            lo = mid
+        else:
+            hi = mid - 1
+    seats = np.maximum(0, lo - sizes)
+    rest = extra - int(seats.sum())
+    if rest:
+        at_level = np.flatnonzero(sizes + seats == lo)[:rest]
+        seats[at_level] += 1
+    return seats
+
 def finalize_step2_assignments(
     df: pd.DataFrame, 
     step2_col: str,
@@ -34,19 +57,23 @@ def finalize_step2_assignments(
             "class_distribution": result_df[final_col_name].value_counts().to_dict()
         }
         return result_df, stats
-    placed_classes = result_df[~unplaced_mask][final_col_name].value_counts()
+    placed_classes = result_df.loc[~unplaced_mask, final_col_name].value_counts()
     available_classes = sorted(placed_classes.index.tolist())
     if not available_classes:
         num_classes = max(2, math.ceil(len(result_df) / 25))
         available_classes = [f"Α{i+1}" for i in range(num_classes)]
         placed_classes = pd.Series([0] * len(available_classes), index=available_classes)
-    unplaced_names = result_df[unplaced_mask]["ΟΝΟΜΑ"].tolist()
-    classes_by_size = placed_classes.sort_values().index.tolist()
-    for i, student_name in enumerate(unplaced_names):
-        target_class = classes_by_size[i % len(classes_by_size)]
-        student_idx = result_df[result_df["ΟΝΟΜΑ"] == student_name].index[0]
-        result_df.loc[student_idx, final_col_name] = target_class
-    final_distribution = result_df[final_col_name].value_counts().to_dict()
+    # μικρότερα τμήματα πρώτα (ισοβαθμία: αλφαβητικά) και water-filling προς ίσα μεγέθη
+    classes_by_size = placed_classes.reindex(available_classes).sort_values(kind="stable")
+    sizes = classes_by_size.to_numpy(dtype=np.int64)
+    seats = _water_fill(sizes, int(unplaced_count))
+    # round-robin στα τμήματα που έχουν ακόμη θέσεις: γύρος r δίνει 1 θέση σε κάθε τμήμα με seats > r
+    slot_class = np.repeat(np.arange(len(seats)), seats)
+    slot_round = np.arange(len(slot_class)) - np.repeat(np.cumsum(seats) - seats, seats)
+    labels = classes_by_size.index.to_numpy()[slot_class[np.lexsort((slot_class, slot_round))]]
+    result_df.loc[unplaced_mask, final_col_name] = labels
+
+    final_distribution = {cl: n for cl, n in zip(classes_by_size.index.tolist(), (sizes + seats).tolist()) if n}
     stats = {
         "total_students": len(result_df),
         "already_placed": len(result_df) - unplaced_count,
@@ -58,16 +85,17 @@ def finalize_step2_assignments(
     return result_df, stats
 
 def validate_final_assignments(df: pd.DataFrame, final_col: str) -> dict:
+    class_sizes = df[final_col].value_counts()
+    assigned = int(class_sizes.sum())
     validation = {
         "total_students": len(df),
-        "students_with_assignment": (~pd.isna(df[final_col])).sum(),
-        "students_without_assignment": pd.isna(df[final_col]).sum(),
-        "is_complete": pd.isna(df[final_col]).sum() == 0,
-        "unique_classes": df[final_col].nunique(),
-        "class_list": sorted(df[final_col].dropna().unique().tolist())
+        "students_with_assignment": assigned,
+        "students_without_assignment": len(df) - assigned,
+        "is_complete": assigned == len(df),
+        "unique_classes": len(class_sizes),
+        "class_list": sorted(class_sizes.index.tolist())
     }
     if validation["is_complete"]:
-        class_sizes = df[final_col].value_counts()
         validation.update({
             "min_class_size": class_sizes.min(),
             "max_class_size": class_sizes.max(),
@@ -88,6 +116,149 @@ def lock_step2_results(df: pd.DataFrame, step2_column: str) -> pd.DataFrame:
     return final_df
 
 # ------------------ Exporters ------------------
+STEP2_EXPORT_LAYOUTS = ("minimal", "full")
+
+def _best_step2_option(options):
+    def key_fn(opt):
+        label, opt_df, m = opt
+        pen = m.get("penalty") if m.get("penalty") is not None else 10**9
+        bro = m.get("broken") if m.get("broken") is not None else 10**9
+        ped = m.get("ped_conflicts") if m.get("ped_conflicts") is not None else 10**9
+        return (pen, bro, ped)
+    return sorted(options, key=key_fn)[0]
+
+def _set_step2_worker_share(share: int) -> None:
+    """Initializer του process pool: μερίδιο διεργασιών για την εσωτερική αναζήτηση του Βήματος 2."""
+    import os
+    from step_2_zoiroi_idiaterotites_FIXED_v3_PATCHED import STEP2_MAX_WORKERS_ENV
+    os.environ[STEP2_MAX_WORKERS_ENV] = str(share)
+
+def _step2_scenario_worker(task):
+    """Worker του process pool: Βήμα 2 για ένα σενάριο, με όλο το μερίδιο της διεργασίας (jobs=0)."""
+    from step_2_zoiroi_idiaterotites_FIXED_v3_PATCHED import step2_apply_FIXED_v3
+    df, step1_col, seed, max_results = task
+    return _best_step2_option(step2_apply_FIXED_v3(df, step1_col, seed=seed, max_results=max_results, jobs=0))
+
+def run_step2_scenarios(
+    step1_workbook_path: str,
+    *,
+    seed: int = 42,
+    max_results: int = 5,
+    jobs: int = 1
+) -> Dict[int, Dict]:
+    """
+    Διαβάζει το workbook του Βήματος 1 μία φορά και τρέχει το Βήμα 2 μία φορά ανά σενάριο ΒΗΜΑ1.
+    Επιστρέφει {sid: {"step1_col", "orig_df", "best_df", "metrics"}} για τα export_step2_*.
+    jobs > 1 (0 = όλος ο προϋπολογισμός) τρέχει τα σενάρια παράλληλα· κάθε διεργασία παίρνει
+    STEP2_MAX_WORKERS = προϋπολογισμός // διεργασίες για τη δική της αναζήτηση.
+    """
+    from step_2_zoiroi_idiaterotites_FIXED_v3_PATCHED import step2_apply_FIXED_v3, step2_worker_budget
+    from step_2_helpers_FIXED import (
+        normalize_columns, extract_step1_id, find_step1_scenario_columns, find_sheets_with_column_prefix
+    )
+
+    xls = pd.ExcelFile(step1_workbook_path)
+    scenarios: Dict[int, Dict] = {}
+    for sh, header_cols in find_sheets_with_column_prefix(xls, "ΒΗΜΑ1_ΣΕΝΑΡΙΟ_").items():
+        if all(extract_step1_id(c) in scenarios for c in header_cols):
+            continue
+        orig_df = xls.parse(sh)
+        df = normalize_columns(orig_df)
+        for step1_col in find_step1_scenario_columns(df):
+            sid = extract_step1_id(step1_col)
+            if sid not in scenarios:
+                scenarios[sid] = {"step1_col": step1_col, "orig_df": orig_df, "df": df}
+
+    sids = sorted(scenarios)
+    tasks = [(scenarios[sid]["df"], scenarios[sid]["step1_col"], seed, max_results) for sid in sids]
+    budget = step2_worker_budget()
+    pool_size = min(budget if jobs == 0 else max(1, min(int(jobs), budget)), len(tasks))
+    best = None
+    if pool_size > 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=pool_size, initializer=_set_step2_worker_share,
+                                     initargs=(max(1, budget // pool_size),)) as pool:
+                best = list(pool.map(_step2_scenario_worker, tasks))
+        except Exception as e:
+            print(f"Η παράλληλη εκτέλεση σεναρίων του Βήματος 2 απέτυχε ({e}) - σειριακή εκτέλεση")
+    if best is None:
+        best = [_best_step2_option(step2_apply_FIXED_v3(df, step1_col, seed=seed, max_results=max_results))
+                for df, step1_col, _, _ in tasks]
+
+    results: Dict[int, Dict] = {}
+    for sid, (best_label, best_df, best_metrics) in zip(sids, best):
+        entry = scenarios[sid]
+        results[sid] = {"step1_col": entry["step1_col"], "orig_df": entry["orig_df"],
+                        "best_df": best_df, "metrics": best_metrics}
+    return results
+
+def _step2_result_col(best_df: pd.DataFrame, sid: int) -> str:
+    step2_col = f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{sid}"
+    if step2_col not in best_df.columns:
+        cands = [c for c in best_df.columns if str(c).startswith("ΒΗΜΑ2_")]
+        if not cands:
+            raise RuntimeError(f"Δεν βρέθηκε στήλη ΒΗΜΑ2 στο αποτέλεσμα για σενάριο {sid}.")
+        step2_col = cands[0]
+    return step2_col
+
+def _step2_minimal_frame(result: Dict, sid: int, core_columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Βασικές στήλες + ΒΗΜΑ1/ΒΗΜΑ2 (τιμές όπως τις κανονικοποίησε το Βήμα 2)."""
+    from step_2_helpers_FIXED import pick_core_columns
+    best_df = result["best_df"]
+    step2_col = _step2_result_col(best_df, sid)
+    cols = pick_core_columns(best_df, core_columns) + [result["step1_col"], step2_col]
+    return best_df[cols].copy()
+
+def _step2_full_frame(result: Dict, sid: int) -> pd.DataFrame:
+    """Όλες οι αρχικές στήλες + ΒΗΜΑ2_ΣΕΝΑΡΙΟ_N αμέσως δεξιά από τη ΒΗΜΑ1_ΣΕΝΑΡΙΟ_N."""
+    orig_df, best_df, step1_col = result["orig_df"], result["best_df"], result["step1_col"]
+    step2_col = _step2_result_col(best_df, sid)
+    if "ΟΝΟΜΑ" not in orig_df.columns:
+        raise RuntimeError("Το αρχικό φύλλο δεν έχει στήλη 'ΟΝΟΜΑ'.")
+    s_step2 = best_df.set_index("ΟΝΟΜΑ")[step2_col]
+    merged = orig_df.copy()
+    merged[step2_col] = merged["ΟΝΟΜΑ"].map(s_step2.to_dict())
+
+    cols = merged.columns.tolist()
+    if step2_col in cols:
+        cols.remove(step2_col)
+    idx = cols.index(step1_col) + 1 if step1_col in cols else len(cols)
+    cols = cols[:idx] + [step2_col] + cols[idx:]
+    return merged[cols]
+
+def export_step2_layouts(
+    step1_workbook_path: str,
+    out_paths: Dict[str, str],
+    *,
+    seed: int = 42,
+    max_results: int = 5,
+    core_columns: Optional[List[str]] = None,
+    sheet_naming: str = "ΣΕΝΑΡΙΟ_{id}",
+    jobs: int = 1,
+    results: Optional[Dict[int, Dict]] = None
+) -> Dict[int, Dict]:
+    """
+    Ένας driver για όλα τα exports του Βήματος 2: out_paths = {"minimal": ..., "full": ...}
+    (οποιοδήποτε υποσύνολο του STEP2_EXPORT_LAYOUTS). Το Βήμα 2 τρέχει μία φορά ανά σενάριο
+    (run_step2_scenarios, ή δίνονται έτοιμα results) και όλα τα layouts γράφονται από αυτά.
+    """
+    unknown = [k for k in out_paths if k not in STEP2_EXPORT_LAYOUTS]
+    if unknown:
+        raise ValueError(f"Άγνωστο layout: {', '.join(unknown)} (επιτρέπονται: {', '.join(STEP2_EXPORT_LAYOUTS)})")
+    if results is None:
+        results = run_step2_scenarios(step1_workbook_path, seed=seed, max_results=max_results, jobs=jobs)
+
+    for layout, out_xlsx_path in out_paths.items():
+        with pd.ExcelWriter(out_xlsx_path, engine="xlsxwriter") as writer:
+            for sid in sorted(results.keys()):
+                if layout == "minimal":
+                    frame = _step2_minimal_frame(results[sid], sid, core_columns)
+                else:
+                    frame = _step2_full_frame(results[sid], sid)
+                frame.to_excel(writer, sheet_name=sheet_naming.format(id=sid), index=False)
+    return results
+
 def export_step2_minimal_nextcol(
     step1_workbook_path: str,
     out_xlsx_path: str,
@@ -98,50 +269,8 @@ def export_step2_minimal_nextcol(
     sheet_naming: str = "ΣΕΝΑΡΙΟ_{id}"
 ) -> None:
     """Παλιός ελαφρύς exporter: κρατά βασικές στήλες + ΒΗΜΑ1/ΒΗΜΑ2."""
-    from step_2_zoiroi_idiaterotites_FIXED_v3_PATCHED import step2_apply_FIXED_v3
-    from step_2_helpers_FIXED import (
-        normalize_columns, extract_step1_id, find_step1_scenario_columns, pick_core_columns
-    )
-
-    xls = pd.ExcelFile(step1_workbook_path)
-    seen_ids = set()
-    outputs: Dict[int, Dict] = {}
-
-    for sh in xls.sheet_names:
-        df_raw = xls.parse(sh)
-        df = normalize_columns(df_raw)
-        step1_cols = find_step1_scenario_columns(df)
-        for step1_col in step1_cols:
-            sid = extract_step1_id(step1_col)
-            if sid in seen_ids:
-                continue
-            seen_ids.add(sid)
-
-            options = step2_apply_FIXED_v3(df, step1_col, seed=seed, max_results=max_results)
-            def key_fn(opt):
-                label, opt_df, m = opt
-                pen = m.get("penalty") if m.get("penalty") is not None else 10**9
-                bro = m.get("broken") if m.get("broken") is not None else 10**9
-                ped = m.get("ped_conflicts") if m.get("ped_conflicts") is not None else 10**9
-                return (pen, bro, ped)
-            best_label, best_df, best_metrics = sorted(options, key=key_fn)[0]
-
-            step2_col = f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{sid}"
-            if step2_col not in best_df.columns:
-                cands = [c for c in best_df.columns if str(c).startswith("ΒΗΜΑ2_")]
-                if not cands:
-                    raise RuntimeError(f"Δεν βρέθηκε στήλη ΒΗΜΑ2 για το σενάριο {sid}.")
-                step2_col = cands[0]
-
-            keep_core = pick_core_columns(best_df, core_columns)
-            cols = keep_core + [step1_col, step2_col]
-            minimal_df = best_df[cols].copy()
-
-            outputs[sid] = {"sheet_name": sheet_naming.format(id=sid), "df": minimal_df}
-
-    with pd.ExcelWriter(out_xlsx_path, engine="xlsxwriter") as writer:
-        for sid in sorted(outputs.keys()):
-            outputs[sid]["df"].to_excel(writer, sheet_name=outputs[sid]["sheet_name"], index=False)
+    export_step2_layouts(step1_workbook_path, {"minimal": out_xlsx_path}, seed=seed,
+                         max_results=max_results, core_columns=core_columns, sheet_naming=sheet_naming)
 
 def export_step2_nextcol_full(
     step1_workbook_path: str,
@@ -157,60 +286,7 @@ def export_step2_nextcol_full(
     - Εκτελεί Βήμα 2 ανά σενάριο και προσθέτει τη «ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{N}»
       αμέσως δεξιά από τη «ΒΗΜΑ1_ΣΕΝΑΡΙΟ_{N}». Ένα sheet ανά σενάριο.
     - Δεν γράφει καμία FINAL/audit στήλη.
+    Για minimal + full μαζί χωρίς δεύτερο υπολογισμό: export_step2_layouts.
     """
-    from step_2_zoiroi_idiaterotites_FIXED_v3_PATCHED import step2_apply_FIXED_v3
-
-    xls = pd.ExcelFile(step1_workbook_path)
-    used_ids = set()
-    outputs: Dict[int, Dict] = {}
-
-    def _sid_from_col(col_name: str) -> int:
-        m = re.search(r'ΣΕΝΑΡΙΟ[_\s]*(\d+)', str(col_name).upper())
-        return int(m.group(1)) if m else 1
-
-    def _find_step1_cols(df: pd.DataFrame):
-        return [c for c in df.columns if str(c).strip().upper().startswith("ΒΗΜΑ1_ΣΕΝΑΡΙΟ_")]
-
-    for sh in xls.sheet_names:
-        orig_df = xls.parse(sh)
-        step1_cols = _find_step1_cols(orig_df)
-        for step1_col in step1_cols:
-            sid = _sid_from_col(step1_col)
-            if sid in used_ids:
-                continue
-            used_ids.add(sid)
-
-            options = step2_apply_FIXED_v3(orig_df.copy(), step1_col, seed=seed, max_results=max_results)
-            def key_fn(opt):
-                label, opt_df, m = opt
-                pen = m.get("penalty") if m.get("penalty") is not None else 10**9
-                bro = m.get("broken") if m.get("broken") is not None else 10**9
-                ped = m.get("ped_conflicts") if m.get("ped_conflicts") is not None else 10**9
-                return (pen, bro, ped)
-            best_label, best_df, best_metrics = sorted(options, key=key_fn)[0]
-
-            step2_col = f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{sid}"
-            if step2_col not in best_df.columns:
-                cands = [c for c in best_df.columns if str(c).startswith("ΒΗΜΑ2_")]
-                if not cands:
-                    raise RuntimeError(f"Δεν βρέθηκε στήλη ΒΗΜΑ2 στο αποτέλεσμα για σενάριο {sid}.")
-                step2_col = cands[0]
-
-            if "ΟΝΟΜΑ" not in orig_df.columns:
-                raise RuntimeError("Το αρχικό φύλλο δεν έχει στήλη 'ΟΝΟΜΑ'.")
-            s_step2 = best_df.set_index("ΟΝΟΜΑ")[step2_col]
-            merged = orig_df.copy()
-            merged[step2_col] = merged["ΟΝΟΜΑ"].map(s_step2.to_dict())
-
-            cols = merged.columns.tolist()
-            if step2_col in cols:
-                cols.remove(step2_col)
-            idx = cols.index(step1_col) + 1 if step1_col in cols else len(cols)
-            cols = cols[:idx] + [step2_col] + cols[idx:]
-            merged = merged[cols]
-
-            outputs[sid] = {"sheet_name": sheet_naming.format(id=sid), "df": merged}
-
-    with pd.ExcelWriter(out_xlsx_path, engine="xlsxwriter") as writer:
-        for sid in sorted(outputs.keys()):
-            outputs[sid]["df"].to_excel(writer, sheet_name=outputs[sid]["sheet_name"], index=False)
+    export_step2_layouts(step1_workbook_path, {"full": out_xlsx_path}, seed=seed,
+                         max_results=max_results, sheet_naming=sheet_naming)
@@ -8,11 +8,12 @@ step3_amivaia_filia_FIXED.py
 - Υπολογίζει broken δυάδες & penalty, επιλέγει έως 5 καλύτερα σενάρια.
 """
 from typing import List, Tuple, Dict, Optional
+from collections import Counter
 import pandas as pd
 import re
 from pathlib import Path
 from step_3_helpers_FIXED import (
-    parse_friends_string, are_mutual_pair, mutual_dyads,
+    mutual_dyads, mutual_friends_index,
     count_broken_dyads, calculate_penalty_score_step3, select_best_scenarios
 )
 
@@ -23,8 +24,8 @@ def _auto_num_classes(df, override=None):
     k = max(2, math.ceil(n/25))
     return int(k if override is None else override)
 
-def _class_fits(df: pd.DataFrame, col: str, class_name: str, add: int=1) -> bool:
-    return (df[col]==class_name).sum() + add <= 25
+def _class_fits(class_sizes: Counter, class_name: str, add: int=1) -> bool:
+    return class_sizes[class_name] + add <= 25
 
 def apply_step3_on_sheet(
     df2: pd.DataFrame,
@@ -46,27 +47,31 @@ def apply_step3_on_sheet(
     unplaced_names = df[df[new_col].isna()]["ΟΝΟΜΑ"].astype(str).tolist()
 
     # δώσε προτεραιότητα σε όσους έχουν ΑΚΡΙΒΩΣ 1 αμοιβαίο φίλο (μονοσήμαντες δυάδες)
-    def mutual_friends_of(u: str) -> list:
-        cell = df.loc[df["ΟΝΟΜΑ"]==u, "ΦΙΛΟΙ"]
-        friends = parse_friends_string(cell.values[0] if not cell.empty else "")
-        return [v for v in friends if are_mutual_pair(df, u, v)]
-    # κατασκεύασε λίστα (u, v, class_v) για v ήδη placed
+    # αμοιβαίοι φίλοι όλων με ένα πέρασμα· κατασκεύασε λίστα (u, v, class_v) για v ήδη placed
+    friends_of = mutual_friends_index(df)
     candidates = []
     for u in unplaced_names:
-        for v in mutual_friends_of(u):
+        for v in friends_of.get(u, ()):
             if v in placed:
                 candidates.append((u, v, placed[v]))
 
     # Ταξινόμηση: λιγότερες επιλογές πρώτα → μειώνει αδιέξοδα
-    degree = {u: len([1 for x in candidates if x[0]==u]) for u in unplaced_names}
-    candidates.sort(key=lambda t: (degree.get(t[0], 99), t[2]))
+    degree = Counter(u for u, _, _ in candidates)
+    candidates.sort(key=lambda t: (degree[t[0]], t[2]))
 
+    # μεγέθη τμημάτων και γραμμές ανά όνομα, ενημερώνονται σε κάθε τοποθέτηση
+    class_sizes = Counter(df[new_col].dropna().tolist())
+    rows_of = df.groupby("ΟΝΟΜΑ", sort=False).indices
+    col_pos = df.columns.get_loc(new_col)
     used_u = set()
     for u, v, cl in candidates:
         if u in used_u:
             continue
-        if _class_fits(df, new_col, cl, add=1):
-            df.loc[df["ΟΝΟΜΑ"]==u, new_col] = cl
+        if _class_fits(class_sizes, cl, add=1):
+            rows = rows_of.get(u, [])
+            class_sizes.subtract(df[new_col].iloc[rows].dropna().tolist())
+            df.iloc[rows, col_pos] = cl
+            class_sizes[cl] += len(rows)
             used_u.add(u)
             # ενημέρωσε και το placed ώστε αν έχει κι άλλος φίλος τον u, τώρα να θεωρείται placed
             placed[u] = cl
@@ -167,20 +172,16 @@ def export_step3_nextcol_full(step2_xlsx_path: str, out_xlsx_path: str) -> str:
     """
     import pandas as pd, re
     from pathlib import Path
+    from step_2_helpers_FIXED import find_sheets_with_column_prefix
 
     p = Path(step2_xlsx_path)
     assert p.exists(), f"Δεν βρέθηκε: {p}"
     xls = pd.ExcelFile(p)
 
     outputs = []
-    for sh in xls.sheet_names:
-        # Δουλεύουμε με κάθε "ΣΕΝΑΡΙΟ_k" sheet
-        df2 = pd.read_excel(p, sheet_name=sh)
-        # βρες τη στήλη ΒΗΜΑ2_ΣΕΝΑΡΙΟ_k
-        s2_cols = [c for c in df2.columns if str(c).strip().upper().startswith("ΒΗΜΑ2_ΣΕΝΑΡΙΟ_")]
-        if not s2_cols:
-            # αν δεν υπάρχει, συνέχισε στο επόμενο sheet
-            continue
+    # Μόνο τα φύλλα που έχουν στήλη ΒΗΜΑ2_ΣΕΝΑΡΙΟ_k (έλεγχος μόνο στις επικεφαλίδες)
+    for sh, s2_cols in find_sheets_with_column_prefix(xls, "ΒΗΜΑ2_ΣΕΝΑΡΙΟ_").items():
+        df2 = xls.parse(sh)
         scenario_col = s2_cols[0]
         # Εφάρμοσε ΒΗΜΑ 3
         df3, meta = apply_step3_on_sheet(df2, scenario_col=scenario_col, num_classes=None)
@@ -173,16 +173,15 @@ def count_groups_by_category_per_class_strict(df: pd.DataFrame, assigned_column:
     
     # ΒΗΜΑ 1: Καταμέτρηση παιδιών εκπαιδευτικών ως ατομικές "ομάδες"
     if step1_results is not None:
-        # Για κάθε σενάριο του Βήματος 1
-        for scenario in step1_results.scenarios:
-            if scenario.column_name == assigned_column:
-                # Αυτά τα παιδιά τοποθετήθηκαν ως individuals στο Βήμα 1
-                for student_name, class_name in scenario.assignments.items():
-                    if class_name in classes:
-                        fake_group = [student_name]
-                        category = get_group_characteristics(fake_group, df)
-                        groups_per_class[class_name][category] += 1
-                break
+        # Το σενάριο του Βήματος 1 για αυτή τη στήλη (lookup στο ευρετήριο)
+        scenario = step1_results.get_scenario_by_column(assigned_column)
+        if scenario is not None:
+            # Αυτά τα παιδιά τοποθετήθηκαν ως individuals στο Βήμα 1
+            for class_name in classes:
+                for student_name in scenario.get_students_in_class(class_name):
+                    fake_group = [student_name]
+                    category = get_group_characteristics(fake_group, df)
+                    groups_per_class[class_name][category] += 1
     
     # ΒΗΜΑ 2 & 3: Εντοπισμός πραγματικών ζευγαριών που διατηρήθηκαν
     processed_students = set()
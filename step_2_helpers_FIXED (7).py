@@ -75,16 +75,20 @@ def are_mutual_friends(df: pd.DataFrame, a: str, b: str) -> bool:
     fb = set(parse_friends_cell(rb.iloc[0].get("ΦΙΛΟΙ","")))
     return (str(b).strip() in fa) and (str(a).strip() in fb)
 
+def flag_mask(df: pd.DataFrame, col: str) -> pd.Series:
+    """Boolean μάσκα «τιμή == Ν» για στήλη σημαίας· όλο False αν λείπει η στήλη."""
+    if col not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[col].astype(str).str.strip().eq("Ν").fillna(False).astype(bool)
+
 def scope_step2(df: pd.DataFrame, step1_col: str) -> Set[str]:
-    s = set()
-    for _, r in df.iterrows():
-        placed = pd.notna(r.get(step1_col))
-        z = str(r.get("ΖΩΗΡΟΣ","")).strip()=="Ν"
-        i = str(r.get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ","")).strip()=="Ν"
-        pk = str(r.get("ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ","")).strip()=="Ν"
-        if (not placed and (z or i)) or (placed and pk):
-            s.add(str(r.get("ΟΝΟΜΑ","")).strip())
-    return s
+    placed = df[step1_col].notna() if step1_col in df.columns else pd.Series(False, index=df.index)
+    zi = flag_mask(df, "ΖΩΗΡΟΣ") | flag_mask(df, "ΙΔΙΑΙΤΕΡΟΤΗΤΑ")
+    pk = flag_mask(df, "ΠΑΙΔΙ_ΕΚΠΑΙΔΕΥΤΙΚΟΥ")
+    mask = (~placed & zi) | (placed & pk)
+    if "ΟΝΟΜΑ" not in df.columns:
+        return {""} if mask.any() else set()
+    return set(df.loc[mask, "ΟΝΟΜΑ"].astype(str).str.strip())
 
 def mutual_pairs_in_scope(df: pd.DataFrame, scope: Set[str]):
     scope = {str(x).strip() for x in scope if str(x).strip()}
@@ -107,3 +111,25 @@ def find_step1_scenario_columns(df: pd.DataFrame) -> List[str]:
 def pick_core_columns(df: pd.DataFrame, core_list: Optional[List[str]] = None) -> List[str]:
     base = core_list or CORE_COLUMNS_DEFAULT
     return [c for c in base if c in df.columns]
+
+# --------- Ανίχνευση φύλλων μόνο από τη γραμμή επικεφαλίδων ---------
+def read_sheet_headers(xls, sheet_name) -> List[str]:
+    """Επικεφαλίδες ενός φύλλου χωρίς ανάγνωση δεδομένων (nrows=0)."""
+    if not isinstance(xls, pd.ExcelFile):
+        xls = pd.ExcelFile(xls)
+    return list(xls.parse(sheet_name, nrows=0).columns)
+
+def find_sheets_with_column_prefix(xls, prefix: str) -> Dict[str, List[str]]:
+    """
+    {φύλλο: στήλες που αρχίζουν με prefix}, με τη σειρά των φύλλων.
+    Διαβάζει μόνο την 1η γραμμή κάθε φύλλου· το πλήρες parse γίνεται μόνο για όσα επιλεγούν.
+    """
+    if not isinstance(xls, pd.ExcelFile):
+        xls = pd.ExcelFile(xls)
+    prefix = prefix.strip().upper()
+    found: Dict[str, List[str]] = {}
+    for sh in xls.sheet_names:
+        cols = [c for c in read_sheet_headers(xls, sh) if str(c).strip().upper().startswith(prefix)]
+        if cols:
+            found[sh] = cols
+    return found
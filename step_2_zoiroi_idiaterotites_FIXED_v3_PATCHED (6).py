@@ -5,10 +5,15 @@ Step 2 — Ζωηροί & Ιδιαιτερότητες (Fixed v3, patched)
   όπου k είναι ο αριθμός από το step1_col_name (π.χ. ΒΗΜΑ1_ΣΕΝΑΡΙΟ_2 -> k=2).
 - Δεν δημιουργεί FINAL/audit στήλες. Μόνο τη στήλη ΒΗΜΑ2.
 """
-from typing import List, Dict, Tuple, Any, Set, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Any, Set, Optional, FrozenSet
+import heapq
+import numpy as np
 import pandas as pd
+import os
 import random
 import re
+import time
 
 def _auto_num_classes(df, override=None):
     import math
@@ -18,82 +23,94 @@ def _auto_num_classes(df, override=None):
     return int(k if override is None else override)
 
 from step_2_helpers_FIXED import (
-    normalize_columns, parse_friends_cell, scope_step2, mutual_pairs_in_scope
+    flag_mask, normalize_columns, parse_friends_cell, scope_step2
 )
 
 RANDOM_SEED = 42
 random.seed(RANDOM_SEED)
 
-def _pair_conflict_penalty(aZ, aI, bZ, bI) -> int:
-    if aI and bI: return 5
-    if (aI and bZ) or (bI and aZ): return 4
-    if aZ and bZ: return 3
-    return 0
-
-def _count_ped_conflicts(df: pd.DataFrame, col: str) -> int:
-    cnt = 0
-    by_class = {}
-    for _, r in df.iterrows():
-        cl = r.get(col)
-        if pd.isna(cl): continue
-        by_class.setdefault(str(cl), []).append(r)
-    for _cl, rows in by_class.items():
-        for i in range(len(rows)):
-            for j in range(i + 1, len(rows)):
-                aZ = str(rows[i].get("ΖΩΗΡΟΣ", "")).strip() == "Ν"
-                aI = str(rows[i].get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν"
-                bZ = str(rows[j].get("ΖΩΗΡΟΣ", "")).strip() == "Ν"
-                bI = str(rows[j].get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν"
-                if _pair_conflict_penalty(aZ, aI, bZ, bI) > 0:
-                    cnt += 1
-    return cnt
-
-def _sum_conflicts(df: pd.DataFrame, col: str) -> int:
-    s = 0
-    by_class = {}
-    for _, r in df.iterrows():
-        cl = r.get(col)
-        if pd.isna(cl): continue
-        by_class.setdefault(str(cl), []).append(r)
-    for _cl, rows in by_class.items():
-        for i in range(len(rows)):
-            for j in range(i + 1, len(rows)):
-                aZ = str(rows[i].get("ΖΩΗΡΟΣ", "")).strip() == "Ν"
-                aI = str(rows[i].get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν"
-                bZ = str(rows[j].get("ΖΩΗΡΟΣ", "")).strip() == "Ν"
-                bI = str(rows[j].get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν"
-                s += _pair_conflict_penalty(aZ, aI, bZ, bI)
-    return s
-
-def _broken_mutual_pairs(df: pd.DataFrame, col: str, scope: Set[str]) -> int:
-    pairs = mutual_pairs_in_scope(df, scope)
-    name2class = {
-        str(r["ΟΝΟΜΑ"]).strip(): str(r.get(col))
-        for _, r in df.iterrows()
-        if pd.notna(r.get(col))
-    }
-    return sum(1 for a, b in pairs if name2class.get(a) != name2class.get(b))
+# Παράλληλη αναζήτηση: συνολικός προϋπολογισμός διεργασιών και ελάχιστο μέγεθος δέντρου (k^m φύλλα)
+STEP2_MAX_WORKERS_ENV = "STEP2_MAX_WORKERS"
+STEP2_PARALLEL_MIN_LEAVES = 20_000
+
+# engine="auto": πάνω από τόσα φύλλα (k^m) η ακριβής αναζήτηση δίνει τη θέση της στην ευρετική
+STEP2_MAX_EXACT_LEAVES = 50_000_000
+STEP2_HEURISTIC_TIME_BUDGET = 5.0
+STEP2_HEURISTIC_MAX_ROUNDS = 200
+STEP2_ENGINES = ("exact", "heuristic", "auto")
+
+def step2_worker_budget() -> int:
+    """
+    Πόσες διεργασίες επιτρέπεται να χρησιμοποιήσει το Βήμα 2 συνολικά: ${STEP2_MAX_WORKERS},
+    αλλιώς όλοι οι πυρήνες. Όταν ο exporter τρέχει ήδη σενάρια παράλληλα, ορίζει στις
+    διεργασίες του το μερίδιο της καθεμιάς, ώστε η εσωτερική αναζήτηση να μην υπερφορτώνει.
+    """
+    try:
+        return max(1, int(os.environ.get(STEP2_MAX_WORKERS_ENV, "") or os.cpu_count() or 1))
+    except ValueError:
+        return max(1, os.cpu_count() or 1)
+
+# Κατηγορία μαθητή για τις παιδαγωγικές συγκρούσεις: 0 = κανένα, 1 = μόνο Ζ, 2 = μόνο Ι, 3 = Ζ+Ι
+def _class_conflict_counts(codes: np.ndarray, kind: np.ndarray, n_codes: int) -> Tuple[List[int], List[int]]:
+    """Ανά κωδικό τμήματος: (πλήθος «μόνο Ζ», πλήθος Ι) — αρκούν για ped/ποινή του τμήματος."""
+    placed = codes >= 0
+    per_class = np.bincount(codes[placed] * 4 + kind[placed], minlength=n_codes * 4).reshape(n_codes, 4)
+    return per_class[:, 1].tolist(), (per_class[:, 2] + per_class[:, 3]).tolist()
+
+def _conflict_totals(zo: List[int], i_all: List[int]) -> Tuple[int, int]:
+    """
+    (πλήθος παιδαγωγικών συγκρούσεων, άθροισμα ποινών) από τα πλήθη Ζ/Ι ανά τμήμα.
+    Κάθε ζεύγος μαθητών Ζ/Ι στο ίδιο τμήμα μετρά ως σύγκρουση, με ποινή Ι–Ι = 5, Ι–Ζ = 4, Ζ–Ζ = 3
+    (μαθητής Ζ+Ι μετρά ως Ι): ped = C(m,2), ποινή = 5·C(I,2) + 4·I·Ζ + 3·C(Ζ,2).
+    """
+    ped = pen = 0
+    for z, i in zip(zo, i_all):
+        m = z + i
+        ped += m * (m - 1) // 2
+        pen += 5 * (i * (i - 1) // 2) + 4 * i * z + 3 * (z * (z - 1) // 2)
+    return ped, pen
+
+def _conflict_delta(zo: int, i_all: int, is_i: bool) -> Tuple[int, int]:
+    """(Δped, Δποινή) όταν ένας μαθητής Ζ/Ι μπαίνει σε τμήμα με zo «μόνο Ζ» και i_all Ι."""
+    return zo + i_all, (5 * i_all + 4 * zo) if is_i else (4 * i_all + 3 * zo)
+
+def _option_key(ped: int, broken: int, total: int) -> Tuple[int, int, int]:
+    """
+    Σειρά προτίμησης λύσεων (μικρότερο = καλύτερο):
+    χωρίς παιδαγωγικές συγκρούσεις → λιγότερες σπασμένες φιλίες → μικρότερη ποινή·
+    αλλιώς μικρότερη ποινή → λιγότερες σπασμένες φιλίες.
+    """
+    return (0, broken, total) if ped == 0 else (1, total, broken)
+
+def _materialize_option(df: pd.DataFrame, step1_col: str, roster: "_Step2Roster",
+                        assignment: Tuple[Tuple[int, str], ...], final_col: str) -> pd.DataFrame:
+    """Το DataFrame μιας επιλεγμένης λύσης: η στήλη Βήματος 1 + οι τοποθετήσεις του Βήματος 2."""
+    out = df.copy()
+    placed = out["ΟΝΟΜΑ"].map({roster.names[j]: cl for j, cl in assignment})
+    hit = placed.notna()
+    col = out[step1_col].copy()  # ίδιο dtype με τη στήλη του Βήματος 1
+    col.loc[hit] = placed[hit]
+    out[final_col] = col
+    return out
 
 def _compute_targets_global(df: pd.DataFrame, step1_col: str, class_labels: List[str]) -> Dict[str, Dict[str, int]]:
-    Z_step1 = {cl: 0 for cl in class_labels}
-    I_step1 = {cl: 0 for cl in class_labels}
-    Z_total_step1 = 0
-    I_total_step1 = 0
-    for _, r in df.iterrows():
-        cl = r.get(step1_col)
-        z = str(r.get("ΖΩΗΡΟΣ", "")).strip() == "Ν"
-        i = str(r.get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν"
-        if not pd.isna(cl):
-            if z:
-                Z_step1[str(cl)] += 1
-                Z_total_step1 += 1
-            if i:
-                I_step1[str(cl)] += 1
-                I_total_step1 += 1
-
-    to_place = df[pd.isna(df[step1_col])]
-    Z_to_place = int((to_place["ΖΩΗΡΟΣ"].astype(str).str.strip() == "Ν").sum())
-    I_to_place = int((to_place["ΙΔΙΑΙΤΕΡΟΤΗΤΑ"].astype(str).str.strip() == "Ν").sum())
+    placed = df[step1_col].notna()
+    z = flag_mask(df, "ΖΩΗΡΟΣ")
+    i = flag_mask(df, "ΙΔΙΑΙΤΕΡΟΤΗΤΑ")
+
+    def _per_class(mask: pd.Series) -> Dict[str, int]:
+        # τμήμα εκτός class_labels → KeyError, όπως και πριν
+        counts = {cl: 0 for cl in class_labels}
+        for cl, n in df.loc[placed & mask, step1_col].astype(str).value_counts().items():
+            counts[cl] += int(n)
+        return counts
+
+    Z_step1 = _per_class(z)
+    I_step1 = _per_class(i)
+    Z_total_step1 = sum(Z_step1.values())
+    I_total_step1 = sum(I_step1.values())
+    Z_to_place = int((~placed & z).sum())
+    I_to_place = int((~placed & i).sum())
 
     Z_final_total = Z_total_step1 + Z_to_place
     I_final_total = I_total_step1 + I_to_place
@@ -109,44 +126,623 @@ def _compute_targets_global(df: pd.DataFrame, step1_col: str, class_labels: List
         "I_step1": I_step1,
     }
 
-def _prereject(assign_map, next_name, next_cl, df, step1_col, class_labels, targets) -> bool:
-    Zc = targets["Z_step1"].copy()
-    Ic = targets["I_step1"].copy()
-    tmp = assign_map.copy()
-    if next_name and next_cl:
-        tmp[next_name] = next_cl
-
-    for n, cl in tmp.items():
-        row = df[df["ΟΝΟΜΑ"] == n].iloc[0]
-        if str(row.get("ΖΩΗΡΟΣ", "")).strip() == "Ν": Zc[cl] += 1
-        if str(row.get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν": Ic[cl] += 1
+@dataclass
+class _Step2Roster:
+    """
+    Ο πληθυσμός του Βήματος 2 «μεταγλωττισμένος» σε λίστες ευθυγραμμισμένες με τις γραμμές του df.
+    Η αναζήτηση δουλεύει μόνο με δείκτες γραμμών· καμία αναζήτηση ονόματος μέσα στο DataFrame.
+    """
+    names: List[str]
+    z: List[bool]                   # ΖΩΗΡΟΣ == Ν
+    i: List[bool]                   # ΙΔΙΑΙΤΕΡΟΤΗΤΑ == Ν
+    conflicts: List[FrozenSet[int]] # γραμμές που αναφέρει η ΣΥΓΚΡΟΥΣΗ κάθε μαθητή
+    degree: List[int]               # |ΣΥΓΚΡΟΥΣΗ| + |ΦΙΛΟΙ|
+    friends: List[FrozenSet[str]]   # ονόματα της στήλης ΦΙΛΟΙ
+    index_of: Dict[str, int]        # 1η γραμμή ανά όνομα
+    step1: List[Optional[str]]      # τμήμα Βήματος 1 (None = ατοποθέτητος)
+    to_place: List[int]             # ατοποθέτητοι Ζ/Ι, με τη σειρά του df
+
+def _compile_roster(df: pd.DataFrame, step1_col: str) -> _Step2Roster:
+    names = df["ΟΝΟΜΑ"].astype(str).tolist()
+    rows_by_name: Dict[str, List[int]] = {}
+    for idx, n in enumerate(names):
+        rows_by_name.setdefault(n, []).append(idx)
+
+    conf_cells = df["ΣΥΓΚΡΟΥΣΗ"].tolist() if "ΣΥΓΚΡΟΥΣΗ" in df.columns else [""] * len(df)
+    friend_cells = df["ΦΙΛΟΙ"].tolist() if "ΦΙΛΟΙ" in df.columns else [""] * len(df)
+    conflicts: List[FrozenSet[int]] = []
+    degree: List[int] = []
+    friends: List[FrozenSet[str]] = []
+    for conf_cell, friend_cell in zip(conf_cells, friend_cells):
+        toks = parse_friends_cell(conf_cell)
+        ftoks = parse_friends_cell(friend_cell)
+        conflicts.append(frozenset(j for t in set(toks) for j in rows_by_name.get(t, ())))
+        degree.append(len(toks) + len(ftoks))
+        friends.append(frozenset(ftoks))
+
+    placed = pd.notna(df[step1_col]).tolist()
+    step1 = [str(v) if p else None for v, p in zip(df[step1_col].tolist(), placed)]
+    zi_raw = ((df["ΖΩΗΡΟΣ"] == "Ν") | (df["ΙΔΙΑΙΤΕΡΟΤΗΤΑ"] == "Ν")).tolist()
+    to_place = [idx for idx in range(len(df)) if not placed[idx] and zi_raw[idx]]
+    return _Step2Roster(
+        names=names, z=flag_mask(df, "ΖΩΗΡΟΣ").tolist(), i=flag_mask(df, "ΙΔΙΑΙΤΕΡΟΤΗΤΑ").tolist(),
+        conflicts=conflicts, degree=degree, friends=friends,
+        index_of={n: rows[0] for n, rows in rows_by_name.items()},
+        step1=step1, to_place=to_place,
+    )
 
-    for cl in class_labels:
-        if Zc[cl] > targets["Z"]["max"]: return False
-        if Ic[cl] > targets["I"]["max"]: return False
+def _mutual_pair_index(roster: _Step2Roster, scope: Set[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Οι αμοιβαίες φιλίες μέσα στο scope (όπως mutual_pairs_in_scope) ως ζεύγη δεικτών γραμμών.
+    Υπολογίζονται μία φορά ανά κλήση· μια σπασμένη φιλία είναι απλή σύγκριση κωδικών τμήματος.
+    """
+    scope = {str(x).strip() for x in scope if str(x).strip()}
+    left: List[int] = []
+    right: List[int] = []
+    for a in sorted(scope):
+        ia = roster.index_of.get(a)
+        if ia is None:
+            continue
+        for b in sorted(roster.friends[ia]):
+            if b <= a or b not in scope:
+                continue
+            ib = roster.index_of.get(b)
+            if ib is not None and a in roster.friends[ib]:
+                left.append(ia); right.append(ib)
+    return np.asarray(left, dtype=np.intp), np.asarray(right, dtype=np.intp)
 
-    if next_name and next_cl and "ΣΥΓΚΡΟΥΣΗ" in df.columns:
-        mask_next = (df["ΟΝΟΜΑ"] == next_name)
-        next_conf_cell = df.loc[mask_next, "ΣΥΓΚΡΟΥΣΗ"]
-        toks_next = set(parse_friends_cell(next_conf_cell.values[0] if not next_conf_cell.empty else ""))
+def _class_twins(roster: _Step2Roster, class_labels: List[str], targets,
+                 pair_a: np.ndarray, pair_b: np.ndarray) -> Dict[str, List[str]]:
+    """
+    Για κάθε τμήμα, τα προηγούμενα τμήματα με ίδιο «στατικό προφίλ»: ίδια πλήθη Ζ/Ι από το Βήμα 1
+    και, για κάθε ατοποθέτητο μαθητή, ίδια απαγόρευση λόγω σύγκρουσης με μέλος του Βήματος 1 και
+    ίδιο πλήθος αμοιβαίων φίλων του Βήματος 1. Όσο δύο τέτοια τμήματα δεν έχουν πάρει ακόμη
+    μαθητή του Βήματος 2, είναι εναλλάξιμα: η εναλλαγή τους δίνει λύση με ίδιες μετρικές.
+    """
+    zo_step1 = {cl: 0 for cl in class_labels}
+    for j, cl in enumerate(roster.step1):
+        if cl in zo_step1 and roster.z[j] and not roster.i[j]:
+            zo_step1[cl] += 1
+    fixed_friends = {j: {cl: 0 for cl in class_labels} for j in roster.to_place}
+    for a, b in zip(pair_a.tolist(), pair_b.tolist()):
+        for s, f in ((a, b), (b, a)):
+            if s in fixed_friends and roster.step1[f] in fixed_friends[s]:
+                fixed_friends[s][roster.step1[f]] += 1
+
+    def signature(cl: str):
+        per_student = tuple(
+            (any(roster.step1[f] == cl for f in roster.conflicts[j]), fixed_friends[j][cl])
+            for j in roster.to_place
+        )
+        return (targets["Z_step1"][cl], targets["I_step1"][cl], zo_step1[cl], per_student)
+
+    sigs = {cl: signature(cl) for cl in class_labels}
+    return {
+        cl: [c2 for c2 in class_labels[:pos] if sigs[c2] == sigs[cl]]
+        for pos, cl in enumerate(class_labels)
+    }
 
-        fixed_same = df[(pd.notna(df[step1_col])) & (df[step1_col] == next_cl)]
-        if any((n in toks_next) for n in fixed_same["ΟΝΟΜΑ"].astype(str).tolist()):
+def _max_flow(cap: List[Dict[int, int]], source: int, sink: int) -> int:
+    """Edmonds–Karp σε λίστα γειτνίασης χωρητικοτήτων (τροποποιείται επιτόπου)."""
+    from collections import deque
+    flow = 0
+    while True:
+        parent = {source: None}
+        queue = deque([source])
+        while queue and sink not in parent:
+            u = queue.popleft()
+            for v, c in cap[u].items():
+                if c > 0 and v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if sink not in parent:
+            return flow
+        push, v = None, sink
+        while parent[v] is not None:
+            u = parent[v]
+            push = cap[u][v] if push is None else min(push, cap[u][v])
+            v = u
+        v = sink
+        while parent[v] is not None:
+            u = parent[v]
+            cap[u][v] -= push
+            cap[v][u] = cap[v].get(u, 0) + push
+            v = u
+        flow += push
+
+def _quota_flow_feasible(students: List[int], domains: Dict[int, List[str]], class_labels: List[str],
+                         lo: Dict[str, int], hi: Dict[str, int]) -> bool:
+    """
+    Υπάρχει ανάθεση κάθε μαθητή σε τμήμα του πεδίου του ώστε κάθε τμήμα να πάρει [lo, hi];
+    Ροή με κάτω όρια: S'→T' πρέπει να κορεστεί (|μαθητές| + Σlo).
+    """
+    S, T, S2, T2 = 0, 1, 2, 3
+    node = {j: 4 + x for x, j in enumerate(students)}
+    cnode = {cl: 4 + len(students) + x for x, cl in enumerate(class_labels)}
+    cap: List[Dict[int, int]] = [dict() for _ in range(4 + len(students) + len(class_labels))]
+    for j in students:
+        cap[S2][node[j]] = 1          # S→μαθητής με όριο [1, 1]
+        for cl in domains[j]:
+            cap[node[j]][cnode[cl]] = 1
+    cap[S][T2] = len(students)
+    for cl in class_labels:
+        if hi[cl] < lo[cl]:
             return False
+        cap[cnode[cl]][T] = hi[cl] - lo[cl]
+        cap[cnode[cl]][T2] = lo[cl]
+    cap[S2][T] = sum(lo.values())
+    cap[T][S] = len(students) + sum(hi.values())
+    return _max_flow(cap, S2, T2) == len(students) + sum(lo.values())
 
-        for n2, cl2 in tmp.items():
-            if cl2 != next_cl: continue
-            mask_n2 = (df["ΟΝΟΜΑ"] == n2)
-            n2_conf_cell = df.loc[mask_n2, "ΣΥΓΚΡΟΥΣΗ"]
-            toks2 = set(parse_friends_cell(n2_conf_cell.values[0] if not n2_conf_cell.empty else ""))
-            if (next_name in toks2) or (n2 in toks_next):
-                return False
+def _diagnose_infeasible(roster: _Step2Roster, class_labels: List[str], targets) -> Optional[str]:
+    """
+    Πολυωνυμικός έλεγχος πριν την αναζήτηση. Επιστρέφει την αιτία αν καμία τοποθέτηση δεν μπορεί
+    να περάσει τους κανόνες (_prereject + κανόνες φύλλου), αλλιώς None. Όλοι οι έλεγχοι είναι
+    αναγκαίες συνθήκες: None δεν εγγυάται ότι υπάρχει λύση.
+    """
+    labels = {"Z": "ζωηρούς", "I": "μαθητές με ιδιαιτερότητα"}
+    for attr in ("Z", "I"):
+        for cl in class_labels:
+            if targets[f"{attr}_step1"][cl] > targets[attr]["max"]:
+                return (f"Το Βήμα 1 έχει ήδη {targets[f'{attr}_step1'][cl]} {labels[attr]} στο {cl} "
+                        f"(μέγιστο {targets[attr]['max']}).")
+
+    to_place = roster.to_place
+    if len(to_place) == 1:
+        return (f"Μόνο ένας μαθητής προς τοποθέτηση ({roster.names[to_place[0]]}): "
+                f"ο κανόνας «όχι όλοι στο ίδιο τμήμα» δεν ικανοποιείται.")
+
+    # πεδία: τμήματα χωρίς μέλος του Βήματος 1 που ο μαθητής αναφέρει στη ΣΥΓΚΡΟΥΣΗ
+    domains: Dict[int, List[str]] = {}
+    for j in to_place:
+        conf = roster.conflicts[j]
+        if j in conf:
+            return f"Ο μαθητής {roster.names[j]} αναφέρει τον εαυτό του στη ΣΥΓΚΡΟΥΣΗ."
+        blocked = {roster.step1[f] for f in conf}
+        domains[j] = [cl for cl in class_labels if cl not in blocked]
+        if not domains[j]:
+            return (f"Ο μαθητής {roster.names[j]} συγκρούεται με μέλη του Βήματος 1 σε όλα τα τμήματα "
+                    f"({', '.join(class_labels)}).")
+
+    hi = {attr: {cl: targets[attr]["max"] - targets[f"{attr}_step1"][cl] for cl in class_labels}
+          for attr in ("Z", "I")}
+    for attr, flags in (("Z", roster.z), ("I", roster.i)):
+        students = [j for j in to_place if flags[j]]
+        lo = {cl: max(0, targets[attr]["q"] - targets[f"{attr}_step1"][cl]) for cl in class_labels}
+        if not _quota_flow_feasible(students, domains, class_labels, lo, hi[attr]):
+            return (f"Τα όρια ανά τμήμα για {labels[attr]} [{targets[attr]['q']}, {targets[attr]['max']}] "
+                    f"δεν ικανοποιούνται με τους {len(students)} προς τοποθέτηση και τις συγκρούσεις τους.")
+
+    # τμήματα που χωρούν κάθε μαθητή (συγκρούσεις + ελεύθερες θέσεις Ζ/Ι μετά το Βήμα 1)
+    reachable = set()
+    for j in to_place:
+        reachable.update(cl for cl in domains[j]
+                         if not (roster.z[j] and hi["Z"][cl] <= 0) and not (roster.i[j] and hi["I"][cl] <= 0))
+    if to_place and len(reachable) == 1:
+        return (f"Όλοι οι προς τοποθέτηση χωρούν μόνο στο {reachable.pop()}: "
+                f"ο κανόνας «όχι όλοι στο ίδιο τμήμα» δεν ικανοποιείται.")
+
+    # κλίκα στον γράφο συγκρούσεων των προς τοποθέτηση μεγαλύτερη από τα τμήματα
+    adj = {j: {x for x in to_place if x != j and (x in roster.conflicts[j] or j in roster.conflicts[x])}
+           for j in to_place}
+    for start in sorted(to_place, key=lambda j: -len(adj[j])):
+        clique = [start]
+        for x in sorted(adj[start], key=lambda j: -len(adj[j])):
+            if all(x in adj[y] for y in clique):
+                clique.append(x)
+        if len(clique) > len(class_labels):
+            names = ", ".join(roster.names[j] for j in clique)
+            return f"{len(clique)} μαθητές συγκρούονται όλοι μεταξύ τους ({names}) αλλά τα τμήματα είναι {len(class_labels)}."
+    return None
+
+def _prereject(assign_map: Dict[int, str], next_idx: int, next_cl: str,
+               roster: _Step2Roster, targets, Zc: Dict[str, int], Ic: Dict[str, int]) -> bool:
+    """
+    Zc/Ic: τρέχοντες μετρητές Ζ/Ι ανά τμήμα (Βήμα 1 + assign_map), χωρίς τον next_idx.
+    Τα υπόλοιπα τμήματα δεν αλλάζουν, οπότε ελέγχεται μόνο το next_cl (O(1)).
+    """
+    if roster.z[next_idx] and Zc[next_cl] + 1 > targets["Z"]["max"]: return False
+    if roster.i[next_idx] and Ic[next_cl] + 1 > targets["I"]["max"]: return False
+
+    conf_next = roster.conflicts[next_idx]
+    if next_idx in conf_next:
+        return False
+    # σύγκρουση με μαθητή που το Βήμα 1 έχει ήδη βάλει στο ίδιο τμήμα
+    if any(roster.step1[j] == next_cl for j in conf_next):
+        return False
+
+    for j, cl2 in assign_map.items():
+        if cl2 != next_cl: continue
+        if (next_idx in roster.conflicts[j]) or (j in conf_next):
+            return False
     return True
 
 def _extract_step1_id(step1_col_name: str) -> int:
     m = re.search(r'(?:ΒΗΜΑ1_|V1_)ΣΕΝΑΡΙΟ[_\s]*(\d+)', str(step1_col_name))
     return int(m.group(1)) if m else 1
 
+class _Step2Search:
+    """
+    Branch-and-bound του Βήματος 2 πάνω στο μεταγλωττισμένο roster.
+    Κρατά τα top-`limit` φύλλα κατά (_option_key, path), όπου path = δείκτες τμημάτων ανά βάθος·
+    η λεξικογραφική σειρά του path είναι η σειρά της DFS. Είναι picklable, ώστε η ίδια αναζήτηση
+    να τρέχει σειριακά (prefix=()) ή ανά shard (πρόθεμα) σε process pool με ίδιο αποτέλεσμα.
+    Forward checking: κάθε ατοποθέτητος μαθητής έχει domain (bitmask τμημάτων) με τους κανόνες
+    του _prereject· σε κάθε κόμβο επιλέγεται ο μαθητής με το μικρότερο domain (MRV, ισοβαθμία
+    κατά τη στατική σειρά), και ο κλάδος κόβεται μόλις κάποιο domain αδειάσει.
+    """
+
+    def __init__(self, roster: _Step2Roster, class_labels: List[str], targets,
+                 pair_a: np.ndarray, pair_b: np.ndarray, limit: int):
+        self.roster = roster
+        self.class_labels = class_labels
+        self.targets = targets
+        self.pair_a, self.pair_b = pair_a, pair_b
+        self.limit = limit
+
+        # κωδικοί τμήματος ανά γραμμή (-1 = χωρίς τμήμα)· οι τοποθετήσεις γράφονται επιτόπου
+        self.class_code: Dict[str, int] = {}
+        for cl in class_labels + [c for c in roster.step1 if c is not None]:
+            self.class_code.setdefault(cl, len(self.class_code))
+        self.base_codes = np.array([self.class_code[c] if c is not None else -1 for c in roster.step1], dtype=np.int64)
+        self.kind = np.array(roster.z, dtype=np.int64) + 2 * np.array(roster.i, dtype=np.int64)
+        self.label_codes = [self.class_code[cl] for cl in class_labels]
+        self.twins = _class_twins(roster, class_labels, targets, pair_a, pair_b)
+
+        self.order = sorted(
+            roster.to_place,
+            key=lambda j: (
+                -(roster.z[j] and roster.i[j]),
+                -roster.i[j],
+                -roster.z[j],
+                -roster.degree[j],
+            ),
+        )
+        self.rank = {j: r for r, j in enumerate(self.order)}
+        # συγκρούσεις (προς οποιαδήποτε κατεύθυνση) μεταξύ ατοποθέτητων μαθητών
+        self.conf_nbrs: Dict[int, Set[int]] = {j: set() for j in self.order}
+        for j in self.order:
+            for u in roster.conflicts[j]:
+                if u != j and u in self.conf_nbrs:
+                    self.conf_nbrs[j].add(u)
+                    self.conf_nbrs[u].add(j)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.codes = self.base_codes.copy()
+        # πλήθη Ζ/Ι ανά τμήμα (μαζί με όσους έβαλε το Βήμα 1) και τρέχοντα ped/ποινή
+        self.cnt_zo, self.cnt_i = _class_conflict_counts(self.codes, self.kind, len(self.class_code))
+        self.ped_now, self.pen_now = _conflict_totals(self.cnt_zo, self.cnt_i)
+        # μετρητές ανά τμήμα: ενημερώνονται στην τοποθέτηση και αναιρούνται στο backtrack
+        self.assign: Dict[int, str] = {}
+        self.Zc = self.targets["Z_step1"].copy()
+        self.Ic = self.targets["I_step1"].copy()
+        self.placed_cnt = {cl: 0 for cl in self.class_labels}
+        # top-K ως max-heap: (-κλειδί, -σειρά, path, τοποθετήσεις, ped, broken, total, conf_sum)
+        self.best: List[tuple] = []
+        self.seq = 0
+        # forward checking: domains ατοποθέτητων + trail αλλαγών για αναίρεση
+        self.unplaced: Set[int] = set(self.order)
+        self.left_i = sum(int(self.roster.i[j]) for j in self.order)
+        self.left_zo = sum(int(self.roster.z[j] and not self.roster.i[j]) for j in self.order)
+        self.dom: Dict[int, int] = {
+            j: sum(1 << pos for pos, cl in enumerate(self.class_labels)
+                   if _prereject({}, j, cl, self.roster, self.targets, self.Zc, self.Ic))
+            for j in self.order
+        }
+        self.dom_size: Dict[int, int] = {j: bin(d).count("1") for j, d in self.dom.items()}
+        self.trail: List[Tuple[int, int]] = []
+        self.marks: List[int] = []
+
+    def _select(self) -> int:
+        """MRV: ο ατοποθέτητος μαθητής με τα λιγότερα αποδεκτά τμήματα (ισοβαθμία: στατική σειρά)."""
+        return min(self.unplaced, key=lambda u: (self.dom_size[u], self.rank[u]))
+
+    def _choices(self, j: int) -> List[int]:
+        """Δείκτες τμημάτων του domain του j που περνούν τη συμμετρία."""
+        out = []
+        dom = self.dom[j]
+        for pos, cl in enumerate(self.class_labels):
+            if not (dom >> pos) & 1:
+                continue
+            # συμμετρία: άδειο (από Βήμα 2) τμήμα με άδειο «δίδυμο» πριν από αυτό δίνει μόνο αντικατοπτρισμούς
+            if self.placed_cnt[cl] == 0 and any(self.placed_cnt[t] == 0 for t in self.twins[cl]):
+                continue
+            out.append(pos)
+        return out
+
+    def _assign(self, j: int, pos: int) -> bool:
+        """
+        Τοποθέτηση με forward checking: αφαιρεί το τμήμα από τα domains των ατοποθέτητων που
+        συγκρούονται με τον j ή που δεν χωρούν πια (Ζ/Ι στο max). False αν κάποιο domain άδειασε·
+        σε κάθε περίπτωση ακολουθεί _retract(j).
+        """
+        cl = self.class_labels[pos]
+        roster, t = self.roster, self.targets
+        self._place(j, cl)
+        self.unplaced.discard(j)
+        self.left_i -= int(roster.i[j]); self.left_zo -= int(roster.z[j] and not roster.i[j])
+        self.marks.append(len(self.trail))
+        full_z = roster.z[j] and self.Zc[cl] >= t["Z"]["max"]
+        full_i = roster.i[j] and self.Ic[cl] >= t["I"]["max"]
+        bit, nbrs, ok = 1 << pos, self.conf_nbrs[j], True
+        for u in (self.unplaced if full_z or full_i else nbrs & self.unplaced):
+            dom = self.dom[u]
+            if dom & bit and (u in nbrs or (full_z and roster.z[u]) or (full_i and roster.i[u])):
+                self.trail.append((u, dom))
+                self.dom[u] = dom & ~bit
+                self.dom_size[u] -= 1
+                ok = ok and dom != bit
+        return ok
+
+    def _retract(self, j: int) -> None:
+        mark = self.marks.pop()
+        while len(self.trail) > mark:
+            u, dom = self.trail.pop()
+            self.dom[u] = dom
+            self.dom_size[u] += 1
+        self.unplaced.add(j)
+        self.left_i += int(self.roster.i[j]); self.left_zo += int(self.roster.z[j] and not self.roster.i[j])
+        self._unplace(j)
+
+    def _place(self, j: int, cl: str) -> None:
+        z, iv = int(self.roster.z[j]), int(self.roster.i[j])
+        c = self.class_code[cl]
+        d_ped, d_pen = _conflict_delta(self.cnt_zo[c], self.cnt_i[c], bool(iv)) if (z or iv) else (0, 0)
+        self.assign[j] = cl
+        self.codes[j] = c
+        self.Zc[cl] += z; self.Ic[cl] += iv; self.placed_cnt[cl] += 1
+        self.cnt_i[c] += iv; self.cnt_zo[c] += z and not iv
+        self.ped_now += d_ped; self.pen_now += d_pen
+
+    def _unplace(self, j: int) -> None:
+        # το Δ υπολογίζεται από τα πλήθη χωρίς τον j: σωστό με οποιαδήποτε σειρά αφαιρέσεων
+        z, iv = int(self.roster.z[j]), int(self.roster.i[j])
+        cl = self.assign.pop(j)
+        c = self.class_code[cl]
+        self.cnt_i[c] -= iv; self.cnt_zo[c] -= z and not iv
+        self.Zc[cl] -= z; self.Ic[cl] -= iv; self.placed_cnt[cl] -= 1
+        self.codes[j] = self.base_codes[j]
+        d_ped, d_pen = _conflict_delta(self.cnt_zo[c], self.cnt_i[c], bool(iv)) if (z or iv) else (0, 0)
+        self.ped_now -= d_ped; self.pen_now -= d_pen
+
+    def _worst_key(self) -> Optional[Tuple[int, int, int]]:
+        if len(self.best) < self.limit:
+            return None
+        return tuple(-x for x in self.best[0][0])
+
+    def _lower_bound_key(self, rem_i: int, rem_zo: int) -> Tuple[int, int, int]:
+        codes, pair_a, pair_b = self.codes, self.pair_a, self.pair_b
+        # οι ήδη κριμένες φιλίες μένουν σπασμένες σε κάθε συμπλήρωση
+        decided = (codes[pair_a] >= 0) & (codes[pair_b] >= 0)
+        broken_lb = int(np.count_nonzero(decided & (codes[pair_a] != codes[pair_b])))
+        # τα πλήθη ανά τμήμα μόνο αυξάνονται: κάθε υπόλοιπος μαθητής προσθέτει τουλάχιστον
+        # το μικρότερο τρέχον Δped και το μικρότερο τρέχον Δποινή (χωριστά, ίσως από άλλο τμήμα)
+        ped_lb, pen_lb = self.ped_now, self.pen_now
+        for rem, is_i in ((rem_i, True), (rem_zo, False)):
+            if rem:
+                deltas = [_conflict_delta(self.cnt_zo[c], self.cnt_i[c], is_i) for c in self.label_codes]
+                ped_lb += rem * min(d[0] for d in deltas)
+                pen_lb += rem * min(d[1] for d in deltas)
+        return _option_key(ped_lb, broken_lb, pen_lb + 5 * broken_lb)
+
+    def _leaf(self, path: Tuple[int, ...]) -> None:
+        targets = self.targets
+        if self.assign and max(self.placed_cnt.values()) == len(self.assign):
+            return
+        for cl in self.class_labels:
+            if not (targets["Z"]["q"] <= self.Zc[cl] <= targets["Z"]["max"]): return
+            if not (targets["I"]["q"] <= self.Ic[cl] <= targets["I"]["max"]): return
+
+        ped_cnt, conf_sum = self.ped_now, self.pen_now
+        broken = int(np.count_nonzero(self.codes[self.pair_a] != self.codes[self.pair_b]))
+        total = conf_sum + 5 * broken
+        key = _option_key(ped_cnt, broken, total)
+        wk = self._worst_key()
+        # ίσο κλειδί με το χειρότερο του heap: έρχεται αργότερα στη DFS, άρα δεν το εκτοπίζει
+        if wk is None or key < wk:
+            item = (tuple(-x for x in key), -self.seq, path, tuple(self.assign.items()),
+                    ped_cnt, broken, total, conf_sum)
+            if wk is None:
+                heapq.heappush(self.best, item)
+            else:
+                heapq.heapreplace(self.best, item)
+        self.seq += 1
+
+    def _backtrack(self, path: Tuple[int, ...]) -> None:
+        if not self.unplaced:
+            self._leaf(path)
+            return
+        wk = self._worst_key()
+        if wk is not None and self._lower_bound_key(self.left_i, self.left_zo) >= wk:
+            return
+        j = self._select()
+        for pos in self._choices(j):
+            if self._assign(j, pos):
+                self._backtrack(path + (pos,))
+            self._retract(j)
+
+    def prefixes(self, depth: int) -> List[Tuple[int, ...]]:
+        """Όλα τα αποδεκτά προθέματα (path) μήκους depth, με σειρά DFS."""
+        self._reset()
+        out: List[Tuple[int, ...]] = []
+
+        def walk(path: Tuple[int, ...]) -> None:
+            if len(path) == depth:
+                out.append(path)
+                return
+            j = self._select()
+            for pos in self._choices(j):
+                if self._assign(j, pos):
+                    walk(path + (pos,))
+                self._retract(j)
+
+        walk(())
+        return out
+
+    def run(self, prefix: Tuple[int, ...] = ()) -> List[tuple]:
+        """
+        Αναζήτηση στο υποδέντρο του prefix. Επιστρέφει έως limit στοιχεία
+        (κλειδί, path, τοποθετήσεις, ped, broken, total, conf_sum), ταξινομημένα κατά (κλειδί, path).
+        """
+        self._reset()
+        # η επιλογή MRV είναι ντετερμινιστική: το πρόθεμα ξαναπαίζεται με τους ίδιους μαθητές
+        for pos in prefix:
+            self._assign(self._select(), pos)
+        self._backtrack(tuple(prefix))
+        items = sorted(self.best, key=lambda x: (tuple(-v for v in x[0]), -x[1]))
+        return [(tuple(-v for v in x[0]),) + x[2:] for x in items]
+
+    def run_parallel(self, jobs: int, split_depth: Optional[int] = None) -> List[tuple]:
+        """
+        Shards ανά πρόθεμα τοποθετήσεων των πρώτων μαθητών, σε process pool. Τα top-limit
+        των shards συγχωνεύονται κατά (κλειδί, path), άρα το αποτέλεσμα είναι ίδιο με το run().
+        """
+        if len(self.order) < 2:
+            return self.run()
+        if split_depth is None:
+            depth = 1
+            prefixes = self.prefixes(depth)
+            while len(prefixes) < 4 * jobs and depth < len(self.order) - 1:
+                depth += 1
+                prefixes = self.prefixes(depth)
+        else:
+            prefixes = self.prefixes(max(0, min(split_depth, len(self.order))))
+
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                shard_results = list(pool.map(_step2_search_shard, [(self, p) for p in prefixes]))
+        except Exception as e:
+            print(f"Η παράλληλη αναζήτηση του Βήματος 2 απέτυχε ({e}) - σειριακή εκτέλεση")
+            return self.run()
+        return sorted((t for top in shard_results for t in top), key=lambda x: (x[0], x[1]))[:self.limit]
+
+
+    # ---------- ευρετική μηχανή (anytime) ----------
+
+    def _violation(self) -> int:
+        """Πόσο απέχει η πλήρης τοποθέτηση από τους κανόνες φύλλου (κάτω όρια Ζ/Ι, όχι όλοι σε ένα τμήμα)."""
+        t = self.targets
+        v = sum(max(0, t["Z"]["q"] - self.Zc[cl]) + max(0, t["I"]["q"] - self.Ic[cl]) for cl in self.class_labels)
+        if self.assign and max(self.placed_cnt.values()) == len(self.assign):
+            v += 1
+        return v
+
+    def _score(self) -> Tuple[int, Tuple[int, int, int], int]:
+        broken = int(np.count_nonzero(self.codes[self.pair_a] != self.codes[self.pair_b]))
+        return self._violation(), _option_key(self.ped_now, broken, self.pen_now + 5 * broken), broken
+
+    def _construct(self, order: List[int], rng: random.Random, randomize: bool) -> bool:
+        """Άπληστη κατασκευή με τους κανόνες του _prereject· κάθε μαθητής στο τμήμα με το καλύτερο φράγμα."""
+        self._reset()
+        for i, j in enumerate(order):
+            scored = []
+            for pos, cl in enumerate(self.class_labels):
+                if not _prereject(self.assign, j, cl, self.roster, self.targets, self.Zc, self.Ic):
+                    continue
+                self._place(j, cl)
+                below_q = (self.Zc[cl] <= self.targets["Z"]["q"]) + (self.Ic[cl] <= self.targets["I"]["q"])
+                scored.append((self._lower_bound_key(0, 0), -below_q,
+                               rng.random() if randomize else 0.0, pos))
+                self._unplace(j)
+            if not scored:
+                return False
+            self._place(j, self.class_labels[min(scored)[3]])
+        return True
+
+    def _try_relocate(self, moves: List[Tuple[int, str]]) -> bool:
+        """Μετακινεί (j → τμήμα) για όλα τα moves ή για κανένα, με τους κανόνες του _prereject."""
+        old = [(j, self.assign[j]) for j, _ in moves]
+        for j, _ in moves:
+            self._unplace(j)
+        done = []
+        for j, cl in moves:
+            if not _prereject(self.assign, j, cl, self.roster, self.targets, self.Zc, self.Ic):
+                for jj, _ in done:
+                    self._unplace(jj)
+                for jj, cl_old in old:
+                    self._place(jj, cl_old)
+                return False
+            self._place(j, cl)
+            done.append((j, cl))
+        return True
+
+    def _undo_relocate(self, moves: List[Tuple[int, str]], old: List[Tuple[int, str]]) -> None:
+        for j, _ in moves:
+            self._unplace(j)
+        for j, cl in old:
+            self._place(j, cl)
+
+    def _neighbourhood(self, rng: random.Random):
+        """Μεμονωμένες μετακινήσεις και ανταλλαγές μεταξύ τμημάτων, με τυχαία σειρά."""
+        order = list(self.order)
+        rng.shuffle(order)
+        for j in order:
+            for cl in self.class_labels:
+                if cl != self.assign[j]:
+                    yield [(j, cl)]
+        for x, j1 in enumerate(order):
+            for j2 in order[x + 1:]:
+                if self.assign[j1] != self.assign[j2]:
+                    yield [(j1, self.assign[j2]), (j2, self.assign[j1])]
+
+    def heuristic(self, time_budget: float, seed: int) -> List[tuple]:
+        """
+        Άπληστη κατασκευή + τοπική αναζήτηση (μετακινήσεις/ανταλλαγές) στον ίδιο στόχο
+        (_option_key), μέσα σε χρονικό όριο. Επιστρέφει τις καλύτερες λύσεις που βρέθηκαν,
+        στη μορφή του run(): (κλειδί, path, τοποθετήσεις, ped, broken, total, conf_sum).
+        """
+        rng = random.Random(seed)
+        deadline = time.monotonic() + time_budget
+        found: Dict[tuple, tuple] = {}
+
+        def record(score) -> None:
+            violation, key, broken = score
+            if violation:
+                return
+            assignment = tuple((j, self.assign[j]) for j in self.order)
+            if assignment not in found:
+                path = tuple(self.class_labels.index(cl) for _, cl in assignment)
+                found[assignment] = (key, len(found), path, assignment,
+                                     self.ped_now, broken, self.pen_now + 5 * broken, self.pen_now)
+
+        order = list(self.order)
+        for rnd in range(STEP2_HEURISTIC_MAX_ROUNDS):
+            if time.monotonic() >= deadline:
+                break
+            if not self._construct(order, rng, randomize=rnd > 0):
+                rng.shuffle(order)
+                continue
+            current = self._score()
+            record(current)
+            improved = True
+            while improved and time.monotonic() < deadline:
+                improved = False
+                for moves in self._neighbourhood(rng):
+                    old = [(j, self.assign[j]) for j, _ in moves]
+                    if not self._try_relocate(moves):
+                        continue
+                    score = self._score()
+                    if score[:2] < current[:2]:
+                        current = score
+                        record(current)
+                        improved = True
+                        break
+                    self._undo_relocate(moves, old)
+            if current[:2] == (0, (0, 0, 0)):
+                break
+
+        items = sorted(found.values(), key=lambda x: (x[0], x[1]))[:self.limit]
+        return [(x[0],) + x[2:] for x in items]
+
+
+def _step2_search_shard(task):
+    """Worker του process pool: αναζήτηση Βήματος 2 σε ένα shard (πρόθεμα)"""
+    search, prefix = task
+    return search.run(prefix)
+
+
 def step2_apply_FIXED_v3(
     df_in: pd.DataFrame,
     step1_col_name: str,
@@ -154,113 +750,70 @@ def step2_apply_FIXED_v3(
     *,
     seed: int = 42,
     max_results: int = 5,
+    jobs: int = 1,
+    split_depth: Optional[int] = None,
+    engine: str = "auto",
+    time_budget: float = STEP2_HEURISTIC_TIME_BUDGET,
 ) -> List[Tuple[str, pd.DataFrame, Dict[str, Any]]]:
     """
     Επιστρέφει έως max_results σενάρια ως (label, DataFrame, metrics).
     Το DataFrame περιέχει στήλες εισόδου + «ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{k}» όπου k = id του ΒΗΜΑ1_ΣΕΝΑΡΙΟ_k.
+    jobs > 1 (0 = όλος ο προϋπολογισμός, βλ. step2_worker_budget) μοιράζει την αναζήτηση
+    σε διεργασίες στο βάθος split_depth (None = αυτόματα)· το αποτέλεσμα είναι ίδιο με το σειριακό.
+    engine: "exact" (branch-and-bound), "heuristic" (άπληστη + τοπική αναζήτηση για time_budget
+    δευτερόλεπτα, metrics["heuristic"] = True) ή "auto" (ευρετική όταν k^m > STEP2_MAX_EXACT_LEAVES).
     """
+    if engine not in STEP2_ENGINES:
+        raise ValueError(f"Άγνωστο engine: {engine} (επιτρέπονται: {', '.join(STEP2_ENGINES)})")
     random.seed(seed)
     df = normalize_columns(df_in).copy()
     num_classes = _auto_num_classes(df, num_classes)
     class_labels = [f"Α{i+1}" for i in range(num_classes)]
     scope = scope_step2(df, step1_col=step1_col_name)
 
-    to_place = df[(pd.isna(df[step1_col_name])) & ((df["ΖΩΗΡΟΣ"] == "Ν") | (df["ΙΔΙΑΙΤΕΡΟΤΗΤΑ"] == "Ν"))]["ΟΝΟΜΑ"].astype(str).tolist()
+    roster = _compile_roster(df, step1_col_name)
     targets = _compute_targets_global(df, step1_col=step1_col_name, class_labels=class_labels)
 
-    best: List[Tuple[pd.DataFrame, int, int, int, int]] = []
-    assign: Dict[str, str] = {}
-
-    def deg(name: str) -> int:
-        row = df[df["ΟΝΟΜΑ"] == name].iloc[0]
-        return len(parse_friends_cell(row.get("ΣΥΓΚΡΟΥΣΗ", ""))) + len(parse_friends_cell(row.get("ΦΙΛΟΙ", "")))
-
-    to_place_sorted = sorted(
-        to_place,
-        key=lambda n: (
-            -(
-                str(df.loc[df["ΟΝΟΜΑ"] == n, "ΖΩΗΡΟΣ"].values[0]).strip() == "Ν"
-                and str(df.loc[df["ΟΝΟΜΑ"] == n, "ΙΔΙΑΙΤΕΡΟΤΗΤΑ"].values[0]).strip() == "Ν"
-            ),
-            -(str(df.loc[df["ΟΝΟΜΑ"] == n, "ΙΔΙΑΙΤΕΡΟΤΗΤΑ"].values[0]).strip() == "Ν"),
-            -(str(df.loc[df["ΟΝΟΜΑ"] == n, "ΖΩΗΡΟΣ"].values[0]).strip() == "Ν"),
-            -deg(n),
-        ),
-    )
-
-    def backtrack(i: int) -> None:
-        if i == len(to_place_sorted):
-            cand = df.copy()
-            cand_col = "ΒΗΜΑ2_TMP"
-            cand[cand_col] = cand[step1_col_name]
-            for n, cl in assign.items():
-                cand.loc[cand["ΟΝΟΜΑ"] == n, cand_col] = cl
-
-            counts_new = {cl: 0 for cl in class_labels}
-            for cl in assign.values():
-                counts_new[cl] += 1
-            if sum(counts_new.values()) > 0 and max(counts_new.values()) == sum(counts_new.values()):
-                return
+    pair_a, pair_b = _mutual_pair_index(roster, scope)
+    search = _Step2Search(roster, class_labels, targets, pair_a, pair_b, limit=max(1, int(max_results)))
 
-            Zc = targets["Z_step1"].copy()
-            Ic = targets["I_step1"].copy()
-            for n, cl in assign.items():
-                row = df[df["ΟΝΟΜΑ"] == n].iloc[0]
-                if str(row.get("ΖΩΗΡΟΣ", "")).strip() == "Ν": Zc[cl] += 1
-                if str(row.get("ΙΔΙΑΙΤΕΡΟΤΗΤΑ", "")).strip() == "Ν": Ic[cl] += 1
-            for cl in class_labels:
-                if not (targets["Z"]["q"] <= Zc[cl] <= targets["Z"]["max"]): return
-                if not (targets["I"]["q"] <= Ic[cl] <= targets["I"]["max"]): return
-
-            ped_cnt = _count_ped_conflicts(cand, cand_col)
-            conf_sum = _sum_conflicts(cand, cand_col)
-            broken = _broken_mutual_pairs(cand, cand_col, scope)
-            total = conf_sum + 5 * broken
-            best.append((cand, ped_cnt, broken, total, conf_sum))
-            return
+    budget = step2_worker_budget()
+    jobs = budget if jobs == 0 else max(1, min(int(jobs), budget))
 
-        name = to_place_sorted[i]
-        for cl in class_labels:
-            if not _prereject(assign, name, cl, df, step1_col_name, class_labels, targets):
-                continue
-            assign[name] = cl
-            backtrack(i + 1)
-            del assign[name]
+    if engine == "auto":
+        engine = "heuristic" if len(class_labels) ** len(search.order) > STEP2_MAX_EXACT_LEAVES else "exact"
 
-    backtrack(0)
+    best: List[tuple] = []
+    diagnosis = _diagnose_infeasible(roster, class_labels, targets)
+    if diagnosis is None:
+        if engine == "heuristic":
+            best = search.heuristic(time_budget, seed)
+        elif jobs > 1 and len(class_labels) ** len(search.order) >= STEP2_PARALLEL_MIN_LEAVES:
+            best = search.run_parallel(jobs, split_depth)
+        else:
+            best = search.run()
 
     if not best:
+        if diagnosis is None:
+            diagnosis = ("Η ευρετική δεν βρήκε αποδεκτή τοποθέτηση στο χρονικό όριο." if engine == "heuristic"
+                         else "Καμία τοποθέτηση δεν ικανοποιεί μαζί τα όρια Ζ/Ι, τις συγκρούσεις και τη διασπορά.")
         tmp = df.copy()
         base_id = _extract_step1_id(step1_col_name)
         tmp[f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{base_id}"] = tmp[step1_col_name]
-        return [("option_1", tmp, {"ped_conflicts": None, "broken": None, "penalty": None})]
-
-    zero_ped = [x for x in best if x[1] == 0]
-    selected = []
-
-    total_pairs = len(mutual_pairs_in_scope(df, scope))
-
-    if zero_ped:
-        min_broken = min(x[2] for x in zero_ped)
-        tier1 = [x for x in zero_ped if x[2] == min_broken]
-        min_total = min(x[3] for x in tier1)
-        tier2 = [x for x in tier1 if x[3] == min_total]
-        selected = tier2
-    else:
-        min_total = min(x[3] for x in best)
-        tier1 = [x for x in best if x[3] == min_total]
-        max_preserved = max(total_pairs - x[2] for x in tier1)
-        tier2 = [x for x in tier1 if (total_pairs - x[2]) == max_preserved]
-        selected = tier2
+        return [("option_1", tmp, {"ped_conflicts": None, "broken": None, "penalty": None,
+                                   "diagnosis": diagnosis})]
+
+    # κρατάμε μόνο την καλύτερη βαθμίδα (ίσο κλειδί με την καλύτερη), με σειρά DFS
+    top_key = best[0][0]
+    selected = [x[2:] for x in best if x[0] == top_key]
 
     results: List[Tuple[str, pd.DataFrame, Dict[str, Any]]] = []
     base_id = _extract_step1_id(step1_col_name)
-    for k, (cand, ped_cnt, broken, total, conf_sum) in enumerate(selected, start=1):
-        out = cand.copy()
-        final_col = f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{base_id}"
-        out[final_col] = out["ΒΗΜΑ2_TMP"]
-        out.drop(columns=["ΒΗΜΑ2_TMP"], inplace=True)
-        results.append((f"option_{k}", out, {
-            "ped_conflicts": int(ped_cnt), "broken": int(broken), "penalty": int(total),
-        }))
+    final_col = f"ΒΗΜΑ2_ΣΕΝΑΡΙΟ_{base_id}"
+    for k, (assignment, ped_cnt, broken, total, conf_sum) in enumerate(selected, start=1):
+        out = _materialize_option(df, step1_col_name, roster, assignment, final_col)
+        metrics = {"ped_conflicts": int(ped_cnt), "broken": int(broken), "penalty": int(total)}
+        if engine == "heuristic":
+            metrics["heuristic"] = True
+        results.append((f"option_{k}", out, metrics))
     return results
@@ -10,6 +10,7 @@ step_3_helpers_FIXED.py
 """
 
 from typing import List, Tuple, Dict, Set
+from collections import Counter
 import pandas as pd
 import re, ast
 
@@ -43,19 +44,35 @@ def are_mutual_pair(df: pd.DataFrame, a: str, b: str) -> bool:
     fb = set(parse_friends_string(rb.iloc[0].get("ΦΙΛΟΙ","")))
     return (str(b).strip() in fa) and (str(a).strip() in fb)
 
+def mutual_friends_index(df: pd.DataFrame) -> Dict[str, List[str]]:
+    """
+    Αμοιβαίοι φίλοι ανά όνομα με ένα πέρασμα στο df· ίδιος κανόνας με το are_mutual_pair
+    (μετρά η πρώτη γραμμή κάθε ονόματος). Σειρά/επαναλήψεις όπως στα ΦΙΛΟΙ.
+    """
+    friends: Dict[str, List[str]] = {}
+    cells = df["ΦΙΛΟΙ"] if "ΦΙΛΟΙ" in df.columns else [""] * len(df)
+    for name, cell in zip(df["ΟΝΟΜΑ"].astype(str), cells):
+        if name not in friends:
+            friends[name] = parse_friends_string(cell)
+    sets = {n: set(f) for n, f in friends.items()}
+    return {a: [b for b in fa if b in sets and a.strip() in sets[b]] for a, fa in friends.items()}
+
 def mutual_dyads(df: pd.DataFrame) -> Set[Tuple[str,str]]:
-    names = df["ΟΝΟΜΑ"].astype(str).str.strip().tolist()
+    names = Counter(df["ΟΝΟΜΑ"].astype(str).str.strip())
     pairs: Set[Tuple[str,str]] = set()
-    for i, a in enumerate(names):
-        for b in names[i+1:]:
-            if are_mutual_pair(df, a, b):
+    for a, friends in mutual_friends_index(df).items():
+        if a not in names:
+            continue
+        for b in friends:
+            # δυάδα με τον εαυτό μόνο όταν το όνομα εμφανίζεται σε δύο γραμμές
+            if b != a or names[a] > 1:
                 pairs.add(tuple(sorted([a,b])))
     return pairs
 
 def count_broken_dyads(before_df: pd.DataFrame, after_df: pd.DataFrame, scenario_col: str) -> int:
     """Μετρά πόσες αμοιβαίες ΔΥΑΔΕΣ σπάνε στο after_df (δηλ. κατανέμονται σε διαφορετικές τάξεις)."""
     pairs = mutual_dyads(before_df)
-    name2class = {str(r["ΟΝΟΜΑ"]).strip(): str(r.get(scenario_col)) for _, r in after_df.iterrows() if pd.notna(r.get(scenario_col))}
+    name2class = {str(n).strip(): str(c) for n, c in zip(after_df["ΟΝΟΜΑ"], after_df[scenario_col]) if pd.notna(c)}
     broken=0
     for a,b in pairs:
         ca = name2class.get(a); cb = name2class.get(b)